@@ -0,0 +1,65 @@
+# Benchmark : ancienne alerte (tableau CQH complet reconstruit pour lire la semaine en cours) contre le moteur
+# d'alertes (périodes en cours CQH/CQM/CQS, seules les études ajoutées depuis le passage précédent sont lues)
+# Usage : python benchmarks/bench_alertes.py [nombre_etudes]
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_conformite import etudes_synthetiques  # noqa: E402
+from cq_alertes import MoteurAlertes  # noqa: E402
+from cq_conformite import calculer_conformite  # noqa: E402
+from cq_notifications import DispatcheurTeams  # noqa: E402
+
+
+def mesure(fonction, n=20):
+    durees = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - t0)
+    return statistics.median(durees) * 1000
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    maintenant = datetime(2025, 6, 11, 17)
+    rows = etudes_synthetiques(n)
+    rows.attrs["generation"] = 1
+
+    def ancienne_alerte():
+        annee, semaine, _ = maintenant.date().isocalendar()
+        df = calculer_conformite(rows, today=maintenant.date()).tableau("CQH", annee)
+        return df[df["Semaine"] == f"S{semaine}"]
+
+    with tempfile.TemporaryDirectory() as dossier:
+        moteur = MoteurAlertes(DispatcheurTeams(url="http://127.0.0.1:9/", chemin=os.path.join(dossier, "n.db")))
+        t0 = time.perf_counter()
+        moteur.evaluer(rows, maintenant)
+        premiere = (time.perf_counter() - t0) * 1000
+
+        # Passages suivants : quelques études arrivées entre deux rafraichissements du cache
+        etat = {"rows": rows}
+
+        def passage_delta():
+            precedent = etat["rows"]
+            delta = etudes_synthetiques(5, seed=len(precedent))
+            delta["Id_ControleStudy"] += len(precedent)
+            delta["StudyDate"] = maintenant - timedelta(hours=1)
+            etat["rows"] = pd.concat([precedent, delta], ignore_index=True)
+            etat["rows"].attrs["generation"] = 1
+            moteur.evaluer(etat["rows"], maintenant)
+
+        avant = mesure(ancienne_alerte, 5)
+        apres = mesure(passage_delta)
+
+    print(f"{n} études synthétiques (p50)")
+    print(f"  ancienne alerte (CQH seul, tableau complet)     : {avant:8.2f} ms")
+    print(f"  moteur d'alertes, premier passage (relecture)   : {premiere:8.2f} ms")
+    print(f"  moteur d'alertes, passage suivant (5 études)    : {apres:8.2f} ms")
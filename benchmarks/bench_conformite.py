@@ -0,0 +1,142 @@
+# Benchmark : ancien calcul (iterrows + un masque booléen par période × machine) contre calculer_conformite().tableau()
+# Usage : python benchmarks/bench_conformite.py [nombre_etudes]
+import contextlib
+import io
+import os
+import random
+import re
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from config import MACHINES, MODULES_PAR_TYPE, CQH_REGEX, CQM_REGEX, CQS_REGEX  # noqa: E402
+from cq_calendrier import calendrier  # noqa: E402
+from cq_conformite import calculer_conformite  # noqa: E402
+from cq_regles import ReglesClassification, TYPES_CQ  # noqa: E402
+
+REGEX = {"CQH": re.compile(CQH_REGEX), "CQM": re.compile(CQM_REGEX), "CQS": re.compile(CQS_REGEX)}
+TOMO = [99, 121]
+
+
+def etudes_synthetiques(n, seed=0):
+    rnd = random.Random(seed)
+    modules = sorted(set().union(*MODULES_PAR_TYPE.values())) + [24, 25, 26, 27, 200]
+    noms = ["CQH hebdo", "CQM mensuel", "CQS semestriel", "Contrôle qualité hebdo", "Daily", "test cqh"]
+    debut = datetime(2024, 1, 1)
+    return pd.DataFrame({
+        "Id_ControleStudy": range(1, n + 1),
+        "Id_Object": [rnd.choice(list(MACHINES) + [999]) for _ in range(n)],
+        "Id_UserModule": [rnd.choice(modules) for _ in range(n)],
+        "Name": [rnd.choice(noms) for _ in range(n)],
+        "StudyDate": [debut + timedelta(days=rnd.random() * 730) for _ in range(n)],
+    })
+
+
+def periodes(today):
+    # Périodes du calendrier (cq_calendrier) pour les deux calculs : seuls le classement, les colonnes et la matrice
+    # sont comparés
+    return {
+        "CQH": (pd.concat([calendrier.periodes("CQH", a) for a in calendrier.annees(today)], ignore_index=True),
+                ["Semaine", "Year"]),
+        "CQM": (pd.concat([calendrier.periodes("CQM", a) for a in calendrier.annees(today)], ignore_index=True),
+                ["Mois", "Year"]),
+        "CQS": (pd.concat([calendrier.periodes("CQS", a) for a in calendrier.annees(today)], ignore_index=True),
+                ["Semestre", "Year"]),
+    }
+
+
+def est_du_type(row, typ):
+    if row["Id_Object"] in TOMO:
+        return bool(REGEX[typ].search(str(row["Name"])))
+    return row["Id_UserModule"] in MODULES_PAR_TYPE[typ]
+
+
+def ancien_calcul(rows, today):
+    # Reproduction fidèle des boucles d'origine de /cq_dashboard :
+    #  - CQH : colonnes = toutes les machines de MACHINES, triées par id
+    #  - CQM : CQ hors de tout mois ignorés, colonnes = machines ayant au moins un CQM, triées par nom
+    #  - CQS : colonnes = machines ayant au moins un CQS, triées par nom
+    df_periodes = periodes(today)
+    resultats = {}
+
+    df_semaines, labels = df_periodes["CQH"]
+    realises = []
+    for _, row in rows.iterrows():
+        if not est_du_type(row, "CQH") or row["Id_Object"] not in MACHINES or pd.isna(row["StudyDate"]):
+            continue
+        realises.append({"Id_Object": row["Id_Object"], "Date": pd.to_datetime(row["StudyDate"]).date()})
+    df = pd.DataFrame(realises)
+    data = []
+    for _, sem in df_semaines.iterrows():
+        ligne = {label: sem[label] for label in labels}
+        for id_obj in sorted(MACHINES.keys()):
+            nom = MACHINES.get(id_obj, ("❓",))[0]
+            done = df[(df["Id_Object"] == id_obj) & (df["Date"] >= sem["DateDebut"]) & (df["Date"] <= sem["DateFin"])]
+            if not done.empty:
+                ligne[nom] = "✅"
+            elif sem["DateFin"] < today:
+                ligne[nom] = "❌"
+            else:
+                ligne[nom] = "⏳"
+        data.append(ligne)
+    resultats["CQH"] = pd.DataFrame(data)
+
+    for typ in ("CQM", "CQS"):
+        df_per, labels = df_periodes[typ]
+        realises = []
+        for _, row in rows.iterrows():
+            if not est_du_type(row, typ) or pd.isna(row["StudyDate"]):
+                continue
+            jour = pd.to_datetime(row["StudyDate"]).date()
+            machine = MACHINES.get(row["Id_Object"], (None,))[0]
+            if not machine:
+                continue
+            if typ == "CQM" and df_per[(df_per["DateDebut"] <= jour) & (df_per["DateFin"] >= jour)].empty:
+                continue
+            realises.append({"Machine": machine, "Date": jour})
+        df = pd.DataFrame(realises)
+        machines = sorted(df["Machine"].unique())
+        data = []
+        for _, per in df_per.iterrows():
+            ligne = {label: per[label] for label in labels}
+            for m in machines:
+                done = df[(df["Machine"] == m) & (df["Date"] >= per["DateDebut"]) & (df["Date"] <= per["DateFin"])]
+                if not done.empty:
+                    ligne[m] = "✅"
+                elif per["DateFin"] < today:
+                    ligne[m] = "❌"
+                else:
+                    ligne[m] = "⏳"
+            data.append(ligne)
+        resultats[typ] = pd.DataFrame(data)
+    return resultats
+
+
+def nouveau_calcul(rows, today):
+    # Chemin de production : classement (règles neuves, sans mémo) puis tableaux de toutes les années suivies
+    with contextlib.redirect_stdout(io.StringIO()):
+        conformite = calculer_conformite(rows, today=today, regles=ReglesClassification())
+        return {typ: conformite.tableau(typ) for typ in TYPES_CQ}
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    today = date(2025, 6, 15)
+    rows = etudes_synthetiques(n)
+
+    t0 = time.perf_counter()
+    ancien = ancien_calcul(rows, today)
+    t1 = time.perf_counter()
+    nouveau = nouveau_calcul(rows, today)
+    t2 = time.perf_counter()
+
+    for typ in ancien:
+        pd.testing.assert_frame_equal(ancien[typ], nouveau[typ], check_dtype=False)
+
+    print(f"{n} études synthétiques, tableaux CQH/CQM/CQS identiques")
+    print(f"  ancien calcul (iterrows + masques) : {t1 - t0:8.3f} s")
+    print(f"  calculer_conformite (searchsorted) : {t2 - t1:8.3f} s")
+    print(f"  accélération                       : x{(t1 - t0) / (t2 - t1):.0f}")
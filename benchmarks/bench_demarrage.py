@@ -0,0 +1,66 @@
+# Benchmark : temps d'import de dashboard_cq_artiscan (python -X importtime), c'est-à-dire le temps avant que le
+# service redémarré puisse répondre, et coût des modules différés chargés à la première page
+# Usage : python benchmarks/bench_demarrage.py [nombre_mesures]
+import os
+import statistics
+import subprocess
+import sys
+
+RACINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DIFFERES = ["pandas", "cq_conformite", "pyarrow.feather", "apscheduler.schedulers.background", "requests"]
+
+
+def importtime(code):
+    # [(self_us, cumul_us, profondeur, module)] dans l'ordre de -X importtime
+    env = {**os.environ, "PYTHONPATH": RACINE + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    sortie = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=RACINE, env=env,
+                            capture_output=True, text=True, check=True).stderr
+    lignes = []
+    for ligne in sortie.splitlines():
+        if not ligne.startswith("import time:") or "self [us]" in ligne:
+            continue
+        self_us, cumul_us, nom = ligne[len("import time:"):].split("|")
+        profondeur = (len(nom) - len(nom.lstrip(" ")) - 1) // 2
+        lignes.append((int(self_us), int(cumul_us), profondeur, nom.strip()))
+    return lignes
+
+
+def cumul(lignes, module):
+    return next(c for _, c, _, nom in lignes if nom == module) / 1000
+
+
+def imports_directs(lignes, module):
+    # -X importtime affiche les sous-modules avant le module qui les importe
+    enfants = []
+    for _, c, profondeur, nom in lignes:
+        if profondeur == 0:
+            if nom == module:
+                return enfants
+            enfants = []
+        elif profondeur == 1:
+            enfants.append((c, nom))
+    return []
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    mesures = [importtime("import dashboard_cq_artiscan") for _ in range(n)]
+    totaux = [cumul(lignes, "dashboard_cq_artiscan") for lignes in mesures]
+    print(f"import dashboard_cq_artiscan ({n} mesures) : médiane {statistics.median(totaux):7.1f} ms, "
+          f"min {min(totaux):7.1f} ms")
+
+    print("  imports directs les plus coûteux (dernière mesure) :")
+    for c, nom in sorted(imports_directs(mesures[-1], "dashboard_cq_artiscan"), reverse=True)[:10]:
+        print(f"    {c / 1000:7.1f} ms  {nom}")
+
+    print("  modules différés, chargés à la première utilisation :")
+    for module in DIFFERES:
+        try:
+            lignes = importtime(f"import dashboard_cq_artiscan, {module}")
+        except subprocess.CalledProcessError:
+            print(f"    {'-':>7}     {module} (non installé)")
+            continue
+        racine = module.split(".")[0]
+        differe = sum(c for _, c, p, nom in lignes if p == 0 and nom != "dashboard_cq_artiscan"
+                      and (nom == racine or nom.startswith(racine + ".")))
+        print(f"    {differe / 1000:7.1f} ms  {module}")
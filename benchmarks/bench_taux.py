@@ -0,0 +1,57 @@
+# Benchmark : taux de la page d'accueil recalculés depuis l'instantané (tableaux complets de l'année) contre la lecture
+# des compteurs de la table des états (cq_etats), avec les taux glissants TAUX_GLISSANTS_SEMAINES
+# Usage : python benchmarks/bench_taux.py [nombre_etudes]
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_conformite import etudes_synthetiques  # noqa: E402
+from cq_conformite import calculer_conformite  # noqa: E402
+from cq_etats import EtatsConformite  # noqa: E402
+
+
+def p50(fonction, n=20):
+    durees = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - t0)
+    return statistics.median(durees) * 1000
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    today = date(2025, 6, 15)
+    rows = etudes_synthetiques(n)
+    rows = rows[rows["StudyDate"].dt.date < today]
+    rows.attrs["generation"] = 1
+
+    def recalcul():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return calculer_conformite(rows, today=today).taux(today.year)
+
+    with tempfile.TemporaryDirectory() as dossier:
+        etats = EtatsConformite(os.path.join(dossier, "etats.db"))
+        t0 = time.perf_counter()
+        etats.mettre_a_jour(rows, today)
+        construction = (time.perf_counter() - t0) * 1000
+        attendu = recalcul()
+        lu = etats.taux(today.year, today)
+        assert attendu[0] == lu[0] and all({m: float(v) for m, v in a.items()} == b for a, b in zip(attendu[1:], lu[1:]))
+
+        avant = p50(recalcul, 5)
+        apres = p50(lambda: etats.taux(today.year, today))
+        glissants = p50(lambda: etats.taux_fenetres(today))
+
+    print(f"{len(rows)} études synthétiques, taux {today.year} identiques (p50)")
+    print(f"  recalcul depuis l'instantané         : {avant:8.2f} ms")
+    print(f"  construction de la table des états   : {construction:8.2f} ms (une fois)")
+    print(f"  lecture des compteurs (année)        : {apres:8.2f} ms")
+    print(f"  taux glissants (toutes les fenêtres) : {glissants:8.2f} ms")
@@ -0,0 +1,60 @@
+# Benchmark : render_template_string (template recompilé à chaque requête) contre render_template (templates/ chargés
+# et compilés une fois par processus), sur les pages "/" et "/cq_dashboard" construites à partir d'études synthétiques
+# Usage : python benchmarks/bench_templates.py [nombre_rendus]
+import os
+import statistics
+import sys
+import time
+from datetime import date
+
+from flask import Flask, render_template, render_template_string
+from jinja2 import FileSystemBytecodeCache
+
+RACINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, RACINE)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_conformite import etudes_synthetiques  # noqa: E402
+from cq_conformite import calculer_conformite  # noqa: E402
+from cq_export import liens_export  # noqa: E402
+
+app = Flask(__name__, template_folder=os.path.join(RACINE, "templates"))
+app.jinja_options = {**app.jinja_options, "bytecode_cache": FileSystemBytecodeCache()}
+
+
+def contextes(today):
+    conformite = calculer_conformite(etudes_synthetiques(5_000), today=today)
+    machines, taux_cqh, taux_cqm, taux_cqs = conformite.taux(today.year)
+    week_number = today.isocalendar()[1]
+    total_weeks = date(today.year, 12, 28).isocalendar()[1]
+    index = dict(taux_cqh=taux_cqh, taux_cqm=taux_cqm, taux_cqs=taux_cqs, machines=machines,
+                 progress_percent=round(week_number / total_weeks * 100, 1), week_number=week_number,
+                 total_weeks=total_weeks, moyenne_cqh=0, moyenne_cqm=0, moyenne_cqs=0,
+                 annee=today.year, annees=conformite.annees())
+    dashboard = dict(df_cqh=conformite.tableau("CQH", today.year), df_cqm=conformite.tableau("CQM", today.year),
+                     df_cqs=conformite.tableau("CQS", today.year), commentaires={}, years=conformite.annees(),
+                     annee=today.year, exports=liens_export(conformite.calendrier, today.year))
+    return {"index.html": index, "cq_dashboard.html": dashboard}
+
+
+def p50(rendu, n):
+    durees = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        rendu()
+        durees.append(time.perf_counter() - t0)
+    return statistics.median(durees) * 1000
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    today = date(2025, 6, 15)
+    with app.test_request_context():
+        for nom, ctx in contextes(today).items():
+            with open(os.path.join(RACINE, "templates", nom), encoding="utf-8") as f:
+                source = f.read()
+            assert render_template_string(source, **ctx) == render_template(nom, **ctx)
+            avant = p50(lambda: render_template_string(source, **ctx), n)
+            apres = p50(lambda: render_template(nom, **ctx), n)
+            print(f"{nom} ({n} rendus, p50)")
+            print(f"  render_template_string : {avant:8.2f} ms")
+            print(f"  render_template        : {apres:8.2f} ms")
@@ -6,6 +6,16 @@ SQL_CONFIG = {
     "database": "DBArtiscan"
 }
 
+# Identifiants SQL, sans saisie au démarrage (redémarrage automatique du service), cherchés dans l'ordre :
+#  1. variables d'environnement SQL_ENV_UTILISATEUR / SQL_ENV_MOT_DE_PASSE
+#  2. fichier SQL_FICHIER_IDENTIFIANTS : {"utilisateur": "...", "mot_de_passe": "..."}, lisible par le seul compte du service
+#  3. trousseau du système (module keyring) : mot de passe du service SQL_KEYRING_SERVICE pour l'utilisateur trouvé en 1 ou 2
+#  4. saisie au clavier, seulement quand le script est lancé depuis une console
+SQL_ENV_UTILISATEUR = "CQ_SQL_UTILISATEUR"
+SQL_ENV_MOT_DE_PASSE = "CQ_SQL_MOT_DE_PASSE"
+SQL_FICHIER_IDENTIFIANTS = "identifiants_sql.json"
+SQL_KEYRING_SERVICE = "dashboard-cq"
+
 # Dictionnaire des machines (ID: (Nom, Couleur)) a retrouver dans la partie inventaire sur artiscan, a adapter au centre
 MACHINES = {
     145: ("Versa HD 3", "#1976D2"),
@@ -31,8 +41,88 @@ MODULES_PAR_TYPE = {
     "CQS": {96, 95, 94, 93, 91, 106},
 }
 
+# Machines dont tous les protocoles partagent le même module (TOMO1 et TOMO2 chez nous) : le type de CQ est déduit du nom via les regex
+MACHINES_CLASSEMENT_PAR_NOM = {99, 121}
+
+# Surcharge éventuelle des modules pour une machine donnée (sinon MODULES_PAR_TYPE)
+MODULES_PAR_MACHINE = {
+    # 25: {"CQH": {70}, "CQM": {71}, "CQS": {72}},
+}
+
 # Base de données pour les commentaires, peut etre laisser comme ca par defaut
 COMMENT_DB = "commentaires_cq.db"
 
 # Webhook Teams, seulement si utilisation de la fonction notification
 WEBHOOK_URL = "https://prod-07.francecentral.logic.azure.com/..."
+
+# Notifications Teams : file d'attente persistante (renvoyée après redémarrage), une alerte par machine et par semaine
+NOTIFICATIONS_DB = "notifications_cq.db"
+TEAMS_TIMEOUT_SECONDES = (5, 15)  # (connexion, lecture)
+TEAMS_ESSAIS_MAX = 8
+# Délai avant un nouvel essai après un échec : doublé à chaque essai (30 s, 1 min, 2 min...), plafonné
+TEAMS_DELAI_INITIAL_SECONDES = 30
+TEAMS_DELAI_MAX_SECONDES = 3600
+TEAMS_VERIFIER_CERTIFICAT = False
+
+# Alertes Teams CQH / CQM / CQS, évaluées toutes les ALERTES_INTERVALLE_SECONDES sur la période en cours :
+# une alerte quand une machine dépasse l'échéance sans CQ, une autre quand le CQ en retard est réalisé.
+# Échéance en heures après le début de la période (au plus tard la fin de la période) ; un type absent n'est pas alerté
+ALERTES_INTERVALLE_SECONDES = 300
+ECHEANCES_ALERTE = {
+    "CQH": 2 * 24 + 16,   # mercredi 16 h
+    "CQM": 14 * 24,       # le 15 du mois
+    "CQS": 120 * 24,      # fin avril / fin octobre
+}
+ECHEANCES_ALERTE_PAR_MACHINE = {
+    # 145: {"CQH": 24 + 12},  # ex : CQH attendu le mardi midi
+}
+
+# États de conformité (machine, type de CQ, période) persistés, mis à jour à chaque rafraichissement ; une période terminée
+# depuis plus de ETATS_FIGEAGE_JOURS n'est plus recalculée (délai laissé aux résultats saisis en retard dans Artiscan)
+ETATS_DB = "etats_cq.db"
+ETATS_FIGEAGE_JOURS = 7
+# Taux glissants (API /api/compliance/taux) : périodes terminées dans les N dernières semaines ou en cours
+TAUX_GLISSANTS_SEMAINES = (4, 13, 52)
+
+# Cache partagé de l'extraction CONTROLE_STUDY/RESULT (en secondes) : au-delà, les données sont rafraichies en arrière-plan
+CACHE_TTL_SECONDES = 300
+
+# Entre deux rafraichissements on ne récupère que les nouvelles études (Id_ControleStudy > dernier connu) ;
+# une relecture complète est faite à cet intervalle (en secondes) pour prendre en compte modifications et suppressions
+RECONCILIATION_COMPLETE_SECONDES = 6 * 3600
+
+# Calendrier des périodes : première année suivie (les années suivantes sont générées à la demande jusqu'à l'année en cours)
+ANNEE_DEBUT = 2024
+
+# Jours ouvrés (lundi=0 ... dimanche=6) : une semaine CQH va du lundi au dernier jour ouvré
+JOURS_OUVRES = [0, 1, 2, 3, 4]
+JOURS_OUVRES_PAR_MACHINE = {
+    # 99: [0, 1, 2, 3, 4, 5],  # ex : TOMO1 en service le samedi
+}
+
+# Jours non travaillés : une période sans aucun jour travaillé pour une machine est marquée ➖ et n'entre pas dans les taux
+JOURS_FERIES = [
+    # "2025-12-25", "2026-01-01",
+]
+FERMETURES_PAR_MACHINE = {
+    # 145: [("2025-08-04", "2025-08-15")],  # ex : maintenance, changement de machine
+}
+
+# Pool de connexions SQL partagé par le site et les tâches planifiées : nombre maximum de connexions simultanées
+# vers le serveur Artiscan, et attente maximale (en secondes) d'une connexion libre avant erreur
+POOL_TAILLE = 4
+POOL_ATTENTE_MAX_SECONDES = 30
+
+# Instantané local de l'extraction (format Feather, nécessite pyarrow) : au redémarrage le site est servi
+# immédiatement depuis ce fichier puis rattrapé depuis Artiscan, et reste consultable si le serveur SQL est arrêté.
+# None pour désactiver
+INSTANTANE_LOCAL = "instantane_cq.feather"
+
+# Mode production (python dashboard_cq_artiscan.py serve) : waitress avec SERVE_THREADS threads,
+# ou gunicorn (Linux uniquement) si SERVE_WORKERS > 1. Le scheduler ne tourne que dans le processus qui obtient
+# SCHEDULER_VERROU ; avec plusieurs workers, les autres relisent INSTANTANE_LOCAL (pyarrow requis) au lieu d'Artiscan
+SERVE_HOTE = "0.0.0.0"
+SERVE_PORT = 5000
+SERVE_THREADS = 8
+SERVE_WORKERS = 1
+SCHEDULER_VERROU = "scheduler_cq.lock"
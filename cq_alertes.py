@@ -0,0 +1,172 @@
+# Moteur d'alertes CQH / CQM / CQS : seule la période en cours de chaque type est évaluée, à partir des seules études
+# arrivées depuis l'évaluation précédente (delta de la synchronisation). Une notification n'est envoyée que sur un
+# changement d'état d'une machine : échéance dépassée sans CQ (⏳ → ❌), puis CQ réalisé après l'alerte (❌ → ✅)
+import bisect
+import threading
+import time
+from datetime import datetime, timedelta
+
+from config import MACHINES, ECHEANCES_ALERTE, ECHEANCES_ALERTE_PAR_MACHINE
+from cq_calendrier import calendrier as calendrier_defaut
+from cq_commun import FAIT, EN_RETARD, EN_COURS, LABELS_PAR_TYPE, LecteurDelta
+from cq_regles import regles as regles_defaut, est_du_type, TYPES_CQ
+
+
+class MoteurAlertes:
+    def __init__(self, notifications, echeances=ECHEANCES_ALERTE, echeances_par_machine=ECHEANCES_ALERTE_PAR_MACHINE,
+                 calendrier=None, regles=None):
+        self.notifications = notifications
+        self.echeances = echeances
+        self.echeances_par_machine = echeances_par_machine
+        self.calendrier = calendrier or calendrier_defaut
+        self.regles = regles or regles_defaut
+        self._lock = threading.Lock()
+        self._delta = LecteurDelta()
+        # Machines suivies par type, comme les colonnes du dashboard (CQM / CQS : au moins un CQ du type)
+        self._machines = {typ: set() for typ in TYPES_CQ}
+        # {(type, id machine): {jours des CQ réalisés depuis le début de la plus ancienne période en cours}}
+        self._jours = {}
+        # {(type, id machine): (début de la période, état)}
+        self._etats = {}
+        self.evaluations = 0
+        self.relectures = 0
+        self.lignes_evaluees = 0
+        self.alertes = 0
+        self.duree_ms = None
+        self.derniere_evaluation = None
+
+    def periodes_en_cours(self, today):
+        # {type: (année, index, libellé, début)} : dernière période commencée (semaine ISO, mois, semestre)
+        en_cours = {}
+        for typ in self.echeances:
+            annee = today.isocalendar()[0] if typ == "CQH" else today.year
+            periodes = self.calendrier.periodes(typ, annee)
+            i = bisect.bisect_right(list(periodes["DateDebut"]), today) - 1
+            if i < 0:
+                continue
+            periode = periodes.iloc[i]
+            libelle = periode[LABELS_PAR_TYPE[typ][0]] if typ != "CQH" else f"{periode['Semaine']} {annee}"
+            en_cours[typ] = (annee, i, libelle, periode["DateDebut"])
+        return en_cours
+
+    def _integrer(self, rows, fenetre):
+        # CQ des lignes reçues : machines suivies par type et jours réalisés dans la fenêtre des périodes en cours
+        if rows.empty:
+            return
+        types = self.regles.classer_lignes(rows)
+        connues = rows["Id_Object"].isin(list(MACHINES)).to_numpy()
+        jours = rows["StudyDate"].dt.date.to_numpy()
+        ids = rows["Id_Object"].to_numpy()
+        recents = jours >= fenetre
+        for typ in self.echeances:
+            masque = est_du_type(types, typ) & connues
+            self._machines[typ].update(int(i) for i in set(ids[masque]))
+            for id_obj, jour in zip(ids[masque & recents], jours[masque & recents]):
+                self._jours.setdefault((typ, int(id_obj)), set()).add(jour)
+
+    def _echeance(self, typ, id_obj, debut, fin):
+        # Échéance en heures après le début de la période, au plus tard à la fin de la période pour la machine
+        heures = self.echeances_par_machine.get(id_obj, {}).get(typ, self.echeances[typ])
+        minuit = datetime.min.time()
+        return min(datetime.combine(debut, minuit) + timedelta(hours=heures),
+                   datetime.combine(fin + timedelta(days=1), minuit))
+
+    def _transitions(self, en_cours, maintenant):
+        transitions = []
+        for typ, (annee, i, libelle, debut) in en_cours.items():
+            ids = sorted(MACHINES) if typ == "CQH" else sorted(self._machines[typ])
+            for id_obj in ids:
+                fins, applicables = self.calendrier.bornes(typ, annee, id_obj)
+                if not applicables[i]:
+                    continue
+                fin = fins[i].item()
+                if any(debut <= jour <= fin for jour in self._jours.get((typ, id_obj), ())):
+                    etat = FAIT
+                elif maintenant >= self._echeance(typ, id_obj, debut, fin):
+                    etat = EN_RETARD
+                else:
+                    etat = EN_COURS
+
+                precedent = self._etats.get((typ, id_obj))
+                self._etats[(typ, id_obj)] = (debut, etat)
+                if precedent is None:
+                    ancien = None   # premier passage depuis le démarrage : l'historique est dans la file de notifications
+                elif precedent[0] != debut:
+                    ancien = EN_COURS
+                else:
+                    ancien = precedent[1]
+                if (etat == EN_RETARD and ancien != EN_RETARD) or (etat == FAIT and ancien in (EN_RETARD, None)):
+                    transitions.append((etat, ancien, typ, libelle, debut, id_obj))
+        return transitions
+
+    def evaluer(self, rows, maintenant=None):
+        # rows : extraction du cache, seules les lignes arrivées depuis l'évaluation précédente sont lues
+        maintenant = maintenant or datetime.now()
+        t0 = time.perf_counter()
+        with self._lock:
+            en_cours = self.periodes_en_cours(maintenant.date())
+            if not en_cours:
+                return []
+            fenetre = min(debut for _, _, _, debut in en_cours.values())
+            nouvelles, relecture = self._delta.a_lire(rows)
+            if relecture:
+                self._machines = {typ: set() for typ in TYPES_CQ}
+                self._jours = {}
+                self.relectures += 1
+            self._integrer(nouvelles, fenetre)
+            self._delta.lu(rows)
+            # Jours antérieurs aux périodes en cours : plus jamais évalués
+            self._jours = {cle: {j for j in jours if j >= fenetre} for cle, jours in self._jours.items()}
+
+            transitions = self._transitions(en_cours, maintenant)
+            self.evaluations += 1
+            self.lignes_evaluees += len(nouvelles)
+        envoyees = self._notifier(transitions)
+        with self._lock:
+            self.alertes += envoyees
+            self.duree_ms = round((time.perf_counter() - t0) * 1000, 2)
+            self.derniere_evaluation = maintenant.isoformat(timespec="seconds")
+        return transitions
+
+    @staticmethod
+    def cle(typ, debut, id_obj, etat):
+        return f"{typ}|{debut.isoformat()}|{id_obj}|{'retard' if etat == EN_RETARD else 'fait'}"
+
+    def _notifier(self, transitions):
+        # Une notification par (état, type, période), une clé de dédoublonnage par machine : pas de doublon
+        # après un redémarrage ou si une machine repasse par le même état
+        cles = {t: self.cle(t[2], t[4], t[5], t[0]) for t in transitions}
+        # Premier passage : ✅ signalé seulement si le retard l'avait été avant le redémarrage
+        inconnus = {t: self.cle(t[2], t[4], t[5], EN_RETARD) for t in transitions if t[0] == FAIT and t[1] is None}
+        non_signales = set(self.notifications.nouvelles_cles(inconnus.values()))
+        nouvelles = set(self.notifications.nouvelles_cles(cles.values()))
+
+        groupes = {}
+        for t in transitions:
+            if cles[t] in nouvelles and inconnus.get(t) not in non_signales:
+                etat, _, typ, libelle, _, id_obj = t
+                groupes.setdefault((etat, typ, libelle), []).append((MACHINES[id_obj][0], cles[t]))
+
+        for (etat, typ, libelle), machines in groupes.items():
+            if etat == EN_RETARD:
+                txt = (f"🚨 **Alerte {typ}**\n\n"
+                       f"Les {typ} suivants n'ont pas été réalisés à l'échéance pour la période {libelle} :\n"
+                       + "\n".join(f"• {nom}" for nom, _ in machines) +
+                       "\nMerci de vérifier avant la clôture de la période !")
+            else:
+                txt = (f"✅ **{typ} régularisés**\n\n"
+                       f"Les {typ} suivants, signalés en retard pour la période {libelle}, ont été réalisés :\n"
+                       + "\n".join(f"• {nom}" for nom, _ in machines))
+            id_ = self.notifications.enfiler({"text": txt}, [cle for _, cle in machines])
+            print(f"[{typ}] {etat} {libelle} : {len(machines)} machine(s), notification Teams {id_} mise en file")
+        return len(groupes)
+
+    def stats(self):
+        with self._lock:
+            etats = {}
+            for (typ, _), (_, etat) in self._etats.items():
+                etats.setdefault(typ, {}).setdefault(etat, 0)
+                etats[typ][etat] += 1
+            return {"evaluations": self.evaluations, "relectures": self.relectures,
+                    "lignes_evaluees": self.lignes_evaluees, "alertes": self.alertes, "duree_ms": self.duree_ms,
+                    "derniere_evaluation": self.derniere_evaluation, "etats": etats}
@@ -0,0 +1,125 @@
+# Calendrier des périodes CQ (semaines ISO, mois, semestres) généré à la demande, année par année
+# Les jours ouvrés, jours fériés et fermetures (maintenance, changement de machine...) sont paramétrables par machine
+# numpy / pandas ne sont importés qu'à la génération d'une année : le module reste léger à l'import
+import threading
+from datetime import date, datetime, timedelta
+
+from config import ANNEE_DEBUT, JOURS_OUVRES, JOURS_OUVRES_PAR_MACHINE, JOURS_FERIES, FERMETURES_PAR_MACHINE
+
+
+def _en_date(d):
+    return d if isinstance(d, date) else date.fromisoformat(d)
+
+
+class CalendrierPeriodes:
+    def __init__(self, annee_debut=ANNEE_DEBUT, jours_ouvres=JOURS_OUVRES, jours_ouvres_par_machine=None,
+                 jours_feries=None, fermetures_par_machine=None):
+        self.annee_debut = annee_debut
+        self.jours_ouvres = sorted(jours_ouvres)
+        self.jours_ouvres_par_machine = JOURS_OUVRES_PAR_MACHINE if jours_ouvres_par_machine is None else jours_ouvres_par_machine
+        self.jours_feries = [_en_date(d) for d in (JOURS_FERIES if jours_feries is None else jours_feries)]
+        self.fermetures_par_machine = FERMETURES_PAR_MACHINE if fermetures_par_machine is None else fermetures_par_machine
+        self._lock = threading.RLock()
+        self._cache = {}
+
+    def _memo(self, cle, calcul):
+        with self._lock:
+            if cle not in self._cache:
+                self._cache[cle] = calcul()
+            return self._cache[cle]
+
+    def annees(self, today=None):
+        # Années affichables : de ANNEE_DEBUT à l'année en cours
+        today = today or date.today()
+        return list(range(self.annee_debut, today.year + 1))
+
+    def debut_suivi(self):
+        # Premier jour utile : la semaine ISO 1 de ANNEE_DEBUT peut commencer fin décembre
+        return datetime(self.annee_debut, 1, 1) - timedelta(days=7)
+
+    # --- Périodes communes (jours ouvrés par défaut) ---
+
+    def periodes(self, typ, annee):
+        import pandas as pd
+        generateurs = {"CQH": self._semaines, "CQM": self._mois, "CQS": self._semestres}
+        return self._memo((typ, annee), lambda: pd.DataFrame(generateurs[typ](annee)))
+
+    def _semaines(self, annee):
+        # Semaines ISO : du lundi au dernier jour ouvré (vendredi par défaut), Year = année ISO
+        nb_semaines = date(annee, 12, 28).isocalendar()[1]
+        dernier = max(self.jours_ouvres)
+        semaines = []
+        for w in range(1, nb_semaines + 1):
+            lundi = date.fromisocalendar(annee, w, 1)
+            semaines.append({
+                "Semaine": f"S{w}",
+                "Year": annee,
+                "DateDebut": lundi,
+                "DateFin": lundi + timedelta(days=dernier)
+            })
+        return semaines
+
+    def _mois(self, annee):
+        mois = []
+        for m in range(1, 13):
+            mois.append({
+                "Mois": f"{datetime(annee, m, 1).strftime('%B').capitalize()} {annee}",
+                "Year": annee,
+                "DateDebut": date(annee, m, 1),
+                "DateFin": (date(annee, m + 1, 1) - timedelta(days=1)) if m < 12 else date(annee, 12, 31)
+            })
+        return mois
+
+    def _semestres(self, annee):
+        return [
+            {"Semestre": f"S1 {annee}", "DateDebut": date(annee, 1, 1), "DateFin": date(annee, 6, 30), "Year": annee},
+            {"Semestre": f"S2 {annee}", "DateDebut": date(annee, 7, 1), "DateFin": date(annee, 12, 31), "Year": annee},
+        ]
+
+    # --- Calendrier par machine ---
+
+    def jours_ouvres_machine(self, id_obj):
+        return sorted(self.jours_ouvres_par_machine.get(id_obj, self.jours_ouvres))
+
+    def jours_non_travailles(self, id_obj):
+        jours = set(self.jours_feries)
+        for debut, fin in self.fermetures_par_machine.get(id_obj, []):
+            debut, fin = _en_date(debut), _en_date(fin)
+            jours.update(debut + timedelta(days=i) for i in range((fin - debut).days + 1))
+        return sorted(jours)
+
+    def bornes(self, typ, annee, id_obj):
+        # (fins, applicables) pour une machine :
+        #  - fins : dernier jour de la période où un CQ compte (dernier jour ouvré de la semaine pour les CQH)
+        #  - applicables : la période contient au moins un jour travaillé (sinon ➖, non comptée dans les taux)
+        return self._memo(("bornes", typ, annee, id_obj), lambda: self._calculer_bornes(typ, annee, id_obj))
+
+    def _calculer_bornes(self, typ, annee, id_obj):
+        import numpy as np
+        periodes = self.periodes(typ, annee)
+        debuts = periodes["DateDebut"].values.astype("datetime64[D]")
+        jours_ouvres = self.jours_ouvres_machine(id_obj)
+        if typ == "CQH":
+            fins = debuts + np.timedelta64(max(jours_ouvres), "D")
+            fins_calendaires = debuts + np.timedelta64(6, "D")
+        else:
+            fins = periodes["DateFin"].values.astype("datetime64[D]")
+            fins_calendaires = fins
+
+        weekmask = [1 if j in jours_ouvres else 0 for j in range(7)]
+        holidays = np.array(self.jours_non_travailles(id_obj), dtype="datetime64[D]")
+        travailles = np.busday_count(debuts, fins_calendaires + np.timedelta64(1, "D"),
+                                     weekmask=weekmask, holidays=holidays)
+        return fins, travailles > 0
+
+    def bornes_colonnes(self, typ, annee, ids):
+        # Matrices (périodes × machines) des fins et de l'applicabilité, dans l'ordre des colonnes du tableau
+        import numpy as np
+        bornes = [self.bornes(typ, annee, id_obj) for id_obj in ids]
+        if not bornes:
+            n = len(self.periodes(typ, annee))
+            return np.empty((n, 0), dtype="datetime64[D]"), np.empty((n, 0), dtype=bool)
+        return np.column_stack([b[0] for b in bornes]), np.column_stack([b[1] for b in bornes])
+
+
+calendrier = CalendrierPeriodes()
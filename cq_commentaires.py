@@ -0,0 +1,108 @@
+# Commentaires justifiant une non-conformité (machine, période, année) : base SQLite en mode WAL,
+# une connexion persistante par thread, lecture des seuls commentaires de l'année affichée
+# Index en mémoire par année, mis à jour à l'écriture (write-through) ; les commentaires n'étant jamais modifiés
+# ni supprimés, MAX(id) suffit à détecter un ajout fait par un autre processus (workers gunicorn)
+import re
+from datetime import date, datetime
+
+from config import COMMENT_DB
+from cq_commun import BaseSQLite
+
+ANNEE_LABEL = re.compile(r"\b(\d{4})\b")
+SEMAINE_LABEL = re.compile(r"^S(\d{1,2})$")
+
+
+def annee_commentaire(semaine, date_commentaire=None):
+    # Année d'une période d'après son libellé ("Mars 2025", "S1 2025") ; pour une semaine CQH ("S12"),
+    # année ISO de la date du commentaire, ou la précédente si la semaine commentée est postérieure à cette date
+    trouve = ANNEE_LABEL.search(semaine or "")
+    if trouve:
+        return int(trouve.group(1))
+    jour = datetime.fromisoformat(date_commentaire).date() if date_commentaire else date.today()
+    annee_iso, semaine_iso, _ = jour.isocalendar()
+    numero = SEMAINE_LABEL.match(semaine or "")
+    if numero and int(numero.group(1)) > semaine_iso:
+        return annee_iso - 1
+    return annee_iso
+
+
+class StockCommentaires(BaseSQLite):
+    def __init__(self, chemin=COMMENT_DB):
+        super().__init__(chemin)
+        self._index = {}
+        self._dernier_id = None
+        self.lectures_sql = 0
+
+    def _creer_schema(self, conn):
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS commentaires (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    machine TEXT,
+                    semaine TEXT,
+                    commentaire TEXT,
+                    auteur TEXT,
+                    date_commentaire DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    annee INTEGER
+                )
+            ''')
+            # Bases créées avant la colonne annee : ajout puis déduction de l'année des commentaires existants
+            colonnes = [ligne[1] for ligne in conn.execute("PRAGMA table_info(commentaires)")]
+            if "annee" not in colonnes:
+                conn.execute("ALTER TABLE commentaires ADD COLUMN annee INTEGER")
+            anciens = conn.execute(
+                "SELECT id, semaine, date_commentaire FROM commentaires WHERE annee IS NULL").fetchall()
+            conn.executemany("UPDATE commentaires SET annee = ? WHERE id = ?",
+                             [(annee_commentaire(semaine, d), id_) for id_, semaine, d in anciens])
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_commentaires_annee_machine_semaine "
+                         "ON commentaires (annee, machine, semaine)")
+
+    def annee(self, annee):
+        # {(machine, période): commentaire} pour une année ; le plus récent l'emporte (ne pas modifier le dict renvoyé)
+        conn = self._connexion()
+        dernier_id = conn.execute("SELECT MAX(id) FROM commentaires").fetchone()[0]
+        with self._lock:
+            if dernier_id != self._dernier_id:
+                self._index.clear()
+                self._dernier_id = dernier_id
+            if annee in self._index:
+                return self._index[annee]
+        lignes = conn.execute(
+            "SELECT machine, semaine, commentaire, auteur, date_commentaire FROM commentaires "
+            "WHERE annee = ? ORDER BY id", (annee,)).fetchall()
+        commentaires = {(m, s): {"commentaire": c, "auteur": a, "date": d} for m, s, c, a, d in lignes}
+        with self._lock:
+            self.lectures_sql += 1
+            if dernier_id == self._dernier_id:
+                self._index[annee] = commentaires
+        return commentaires
+
+    def ajouter(self, machine, semaine, commentaire, auteur, annee=None):
+        annee = annee or annee_commentaire(semaine)
+        conn = self._connexion()
+        with conn:
+            curseur = conn.execute(
+                "INSERT INTO commentaires (machine, semaine, commentaire, auteur, annee) VALUES (?, ?, ?, ?, ?)",
+                (machine, semaine, commentaire, auteur, annee))
+        id_, date_commentaire = conn.execute(
+            "SELECT id, date_commentaire FROM commentaires WHERE id = ?", (curseur.lastrowid,)).fetchone()
+        with self._lock:
+            if self._dernier_id is not None and id_ == self._dernier_id + 1:
+                # Aucun autre ajout entre-temps : l'index de l'année est complété (copie, les rendus en cours gardent l'ancien)
+                if annee in self._index:
+                    self._index[annee] = {**self._index[annee],
+                                          (machine, semaine): {"commentaire": commentaire, "auteur": auteur,
+                                                               "date": date_commentaire}}
+                self._dernier_id = id_
+            else:
+                self._index.clear()
+                self._dernier_id = None
+        return annee
+
+    def commentaire(self, machine, semaine, annee):
+        return self.annee(annee).get((machine, semaine))
+
+    def stats(self):
+        with self._lock:
+            return {"annees_en_memoire": sorted(self._index), "lectures_sql": self.lectures_sql,
+                    "dernier_id": self._dernier_id}
@@ -0,0 +1,56 @@
+# Éléments partagés par les calculs de conformité, le moteur d'alertes et les bases SQLite (module léger à l'import)
+import sqlite3
+import threading
+
+# État d'une machine sur une période
+FAIT = "✅"
+EN_RETARD = "❌"
+EN_COURS = "⏳"
+NON_APPLICABLE = "➖"
+
+# Colonnes de libellé des tableaux par type : nom de la période, année
+LABELS_PAR_TYPE = {"CQH": ["Semaine", "Year"], "CQM": ["Mois", "Year"], "CQS": ["Semestre", "Year"]}
+
+
+class LecteurDelta:
+    # Lignes de l'extraction du cache pas encore lues : d'une génération de la synchronisation à l'autre les lignes
+    # existantes sont inchangées et les nouvelles études ajoutées à la fin (voir SyncIncrementale)
+    def __init__(self):
+        self.generation = None
+        self.lignes = 0
+
+    def a_lire(self, rows):
+        # (lignes à lire, relecture) : toute l'extraction si elle a été remplacée (relecture complète, instantané local)
+        generation = rows.attrs.get("generation")
+        if generation is None or generation != self.generation or len(rows) < self.lignes:
+            return rows, True
+        return rows.iloc[self.lignes:], False
+
+    def lu(self, rows):
+        self.generation, self.lignes = rows.attrs.get("generation"), len(rows)
+
+
+class BaseSQLite:
+    # Base SQLite en mode WAL (un seul processus écrit, les workers lisent) : une connexion persistante par thread,
+    # schéma créé (_creer_schema) à la première connexion
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._schema_pret = False
+
+    def _connexion(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.chemin, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                if not self._schema_pret:
+                    self._creer_schema(conn)
+                    self._schema_pret = True
+        return conn
+
+    def _creer_schema(self, conn):
+        raise NotImplementedError
@@ -0,0 +1,202 @@
+# Moteur de calcul des tableaux de conformité CQ (✅ / ❌ / ⏳) par période et par machine
+# Calcul unique partagé par les routes Flask, l'export CSV et l'alerte Teams
+import hashlib
+import json
+import threading
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from config import MACHINES
+from cq_calendrier import calendrier as calendrier_defaut
+from cq_commun import FAIT, EN_RETARD, EN_COURS, NON_APPLICABLE, LABELS_PAR_TYPE
+from cq_regles import regles as regles_defaut, est_du_type
+
+
+def _jours(serie):
+    # date / datetime / Timestamp -> datetime64[D] (l'heure de l'étude est ignorée, comme avec .date())
+    return pd.to_datetime(pd.Series(serie)).values.astype("datetime64[D]")
+
+
+def tableau_conformite(realises, periodes, colonnes, today, labels, bornes=None):
+    # realises : DataFrame avec les colonnes "Cle" (id ou nom de machine) et "Date" des CQ réalisés
+    # periodes : DataFrame avec "DateDebut", "DateFin" (bornes incluses) + les colonnes `labels`,
+    #            triées par date de début et sans chevauchement (semaines L-V, mois, semestres)
+    # colonnes : liste ordonnée de (cle, nom de colonne) à afficher
+    # bornes   : optionnel, (fins, applicables) par période × colonne (calendrier propre à chaque machine)
+    debuts = _jours(periodes["DateDebut"])
+    if bornes is None:
+        fins = np.repeat(_jours(periodes["DateFin"])[:, None], len(colonnes), axis=1)
+        applicables = np.ones(fins.shape, dtype=bool)
+    else:
+        fins, applicables = bornes
+
+    # Par défaut : ❌ si la période est passée, ⏳ sinon, ➖ si la machine ne travaille pas sur la période
+    matrice = np.where(fins < np.datetime64(today, "D"), EN_RETARD, EN_COURS).astype(object)
+    matrice[~applicables] = NON_APPLICABLE
+
+    if len(realises) and len(periodes) and len(colonnes):
+        # Affectation de chaque CQ à sa période par recherche dichotomique sur les dates de début
+        jours = _jours(realises["Date"])
+        idx = np.searchsorted(debuts, jours, side="right") - 1
+
+        position = {cle: j for j, (cle, _) in enumerate(colonnes)}
+        col = realises["Cle"].map(position).to_numpy()
+        ok = (idx >= 0) & ~pd.isna(col)
+        idx, col, jours = idx[ok], col[ok].astype(int), jours[ok]
+        dans_periode = jours <= fins[idx, col]
+        matrice[idx[dans_periode], col[dans_periode]] = FAIT
+
+    resultat = periodes[labels].reset_index(drop=True)
+    noms = [nom for _, nom in colonnes]
+    return pd.concat([resultat, pd.DataFrame(matrice, columns=noms)], axis=1)
+
+
+def hors_periodes(dates, periodes):
+    # Masque des dates qui ne tombent dans aucune période (ex : CQH réalisé un week-end)
+    jours = _jours(dates)
+    if not len(periodes):
+        return np.ones(len(jours), dtype=bool)
+    debuts = _jours(periodes["DateDebut"])
+    fins = _jours(periodes["DateFin"])
+    idx = np.searchsorted(debuts, jours, side="right") - 1
+    return ~((idx >= 0) & (jours <= fins[np.clip(idx, 0, None)]))
+
+
+# --- Classification des études ---
+
+NOMS_MACHINES = {id_obj: infos[0] for id_obj, infos in MACHINES.items()}
+
+
+def cq_realises(rows, par_nom=False):
+    # Format attendu par tableau_conformite : une ligne (Cle, Date) par CQ réalisé
+    cle = rows["Id_Object"].map(NOMS_MACHINES) if par_nom else rows["Id_Object"]
+    return pd.DataFrame({"Cle": cle, "Date": rows["StudyDate"]})
+
+
+# --- Calcul partagé ---
+
+class Conformite:
+    # CQ réalisés classés une fois par instantané ; tableaux et taux construits à la demande, année par année
+    def __init__(self, version, today, realises, colonnes, calendrier):
+        self.version = version
+        self.today = today
+        self.realises = realises      # {type: DataFrame (Cle, Date)}
+        self.colonnes = colonnes      # {type: [(cle, nom de colonne, id machine)]}
+        self.calendrier = calendrier
+        self._lock = threading.RLock()
+        self._tableaux = {}
+        self._taux = {}
+        self._json = {}
+
+    def annees(self):
+        return self.calendrier.annees(self.today)
+
+    def tableau(self, typ, annee=None):
+        # Sans année : toutes les années suivies, de ANNEE_DEBUT à l'année en cours
+        if annee is None:
+            return pd.concat([self.tableau(typ, a) for a in self.annees()], ignore_index=True)
+        with self._lock:
+            if (typ, annee) not in self._tableaux:
+                self._tableaux[(typ, annee)] = self._calculer_tableau(typ, annee)
+            return self._tableaux[(typ, annee)]
+
+    def _calculer_tableau(self, typ, annee):
+        periodes = self.calendrier.periodes(typ, annee)
+        colonnes = self.colonnes[typ]
+        bornes = self.calendrier.bornes_colonnes(typ, annee, [id_obj for _, _, id_obj in colonnes])
+        return tableau_conformite(self.realises[typ], periodes, [(cle, nom) for cle, nom, _ in colonnes],
+                                  self.today, LABELS_PAR_TYPE[typ], bornes)
+
+    def json_tableau(self, typ, annee):
+        # (corps JSON, empreinte) d'un tableau : sérialisé une fois par instantané, l'empreinte sert d'ETag
+        with self._lock:
+            if (typ, annee) not in self._json:
+                df = self.tableau(typ, annee)
+                labels = LABELS_PAR_TYPE[typ]
+                machines = [c for c in df.columns if c not in labels]
+                taux = dict(zip(LABELS_PAR_TYPE, self.taux(annee)[1:]))[typ]
+                corps = json.dumps({
+                    "type": typ,
+                    "annee": annee,
+                    "date_reference": self.today.isoformat(),
+                    "periodes": labels,
+                    "machines": machines,
+                    "lignes": df.to_dict("records"),
+                    "taux": {m: taux.get(m) for m in machines},
+                }, ensure_ascii=False, default=int).encode("utf-8")
+                self._json[(typ, annee)] = (corps, hashlib.sha1(corps).hexdigest())
+            return self._json[(typ, annee)]
+
+    def taux(self, annee):
+        if annee not in self._taux:
+            self._taux[annee] = self._calculer_taux(annee)
+        return self._taux[annee]
+
+    def _calculer_taux(self, annee):
+        tableaux = {typ: self.tableau(typ, annee) for typ in LABELS_PAR_TYPE}
+        colonnes = {typ: [c for c in df.columns if c not in LABELS_PAR_TYPE[typ]] for typ, df in tableaux.items()}
+        machines = sorted(set().union(*colonnes.values()))
+
+        taux = {typ: {} for typ in LABELS_PAR_TYPE}
+        for typ, df in tableaux.items():
+            for m in machines:
+                if m not in colonnes[typ]:
+                    taux[typ][m] = 0.0
+                    continue
+                conforme = (df[m] == FAIT).sum()
+                a_juger = df[m].isin([FAIT, EN_RETARD]).sum()
+                taux[typ][m] = round((conforme / a_juger) * 100, 1) if a_juger > 0 else 100.0
+        return machines, taux["CQH"], taux["CQM"], taux["CQS"]
+
+
+def calculer_conformite(rows, version=None, today=None, calendrier=None, regles=None):
+    today = today or date.today()
+    calendrier = calendrier or calendrier_defaut
+    regles = regles or regles_defaut
+    types = regles.classer_lignes(rows)
+    suivies = rows["StudyDate"].notna() & (rows["StudyDate"] >= calendrier.debut_suivi())
+    connues = rows["Id_Object"].isin(list(MACHINES))
+
+    # CQH : toutes les machines sont affichées, y compris celles sans aucun CQH
+    cqh = rows[est_du_type(types, "CQH") & connues & suivies]
+
+    # CQH dont la date ne tombe dans aucune semaine de l'année en cours (ex : week-end)
+    cqh_annee = cqh[cqh["StudyDate"].dt.year == today.year]
+    cqh_outside_weeks = cqh_annee[hors_periodes(cqh_annee["StudyDate"], calendrier.periodes("CQH", today.year))]
+    if not cqh_outside_weeks.empty:
+        for item in cqh_outside_weeks.itertuples(index=False):
+            print(f"❌ {item.Name} — Machine ID {item.Id_Object} — Date {item.StudyDate.date()}")
+        print(f"➡️ Total {today.year} : {len(cqh_outside_weeks)} / {len(cqh_annee)} CQH hors semaine.")
+
+    # CQM / CQS : seules les machines ayant au moins un CQ sur la période suivie sont affichées
+    cqm = rows[est_du_type(types, "CQM") & connues & suivies]
+    cqs = rows[est_du_type(types, "CQS") & connues & suivies]
+
+    colonnes = {
+        "CQH": [(id_obj, NOMS_MACHINES[id_obj], id_obj) for id_obj in sorted(MACHINES)],
+        "CQM": [(NOMS_MACHINES[i], NOMS_MACHINES[i], i) for i in sorted(cqm["Id_Object"].unique(), key=NOMS_MACHINES.get)],
+        "CQS": [(NOMS_MACHINES[i], NOMS_MACHINES[i], i) for i in sorted(cqs["Id_Object"].unique(), key=NOMS_MACHINES.get)],
+    }
+    realises = {
+        "CQH": cq_realises(cqh),
+        "CQM": cq_realises(cqm, par_nom=True),
+        "CQS": cq_realises(cqs, par_nom=True),
+    }
+    return Conformite(version, today, realises, colonnes, calendrier)
+
+
+_memo_lock = threading.Lock()
+_memo = {}
+
+
+def conformite_memo(rows, version, today=None):
+    # Un seul calcul par (version de l'instantané, date de référence) : les appels concurrents attendent le même résultat
+    today = today or date.today()
+    cle = (version, today)
+    with _memo_lock:
+        if cle not in _memo:
+            _memo.clear()
+            _memo[cle] = calculer_conformite(rows, version, today)
+        return _memo[cle]
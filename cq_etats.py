@@ -0,0 +1,297 @@
+# États de conformité matérialisés par (type de CQ, machine, période) : base SQLite en mode WAL (un seul processus
+# écrit, les workers lisent), avec le premier CQ réalisé (horodatage, Id_ControleStudy) de chaque période
+# Mise à jour à chaque rafraichissement à partir des seules études nouvelles (delta de la synchronisation) ; une période
+# terminée depuis plus de ETATS_FIGEAGE_JOURS est figée (❌ si aucun CQ) et n'est plus jamais recalculée
+# Compteurs (conformes / jugées) par type, machine et année, et cumuls par période, mis à jour quand une période est
+# figée : taux annuels et taux glissants (TAUX_GLISSANTS_SEMAINES) lus en O(machines), seules les périodes en cours
+# (quelques lignes par machine) étant agrégées à la lecture
+import json
+import threading
+import time
+from datetime import date, timedelta
+
+import config
+from config import ETATS_DB, ETATS_FIGEAGE_JOURS, MACHINES, TAUX_GLISSANTS_SEMAINES
+from cq_calendrier import calendrier as calendrier_defaut
+from cq_commun import FAIT, EN_RETARD, EN_COURS, NON_APPLICABLE, LABELS_PAR_TYPE, BaseSQLite, LecteurDelta
+from cq_regles import regles as regles_defaut, est_du_type, TYPES_CQ
+
+# Paramètres dont dépendent les états (et version des tables) : s'ils changent, les tables sont reconstruites
+VERSION_SCHEMA = 2
+PARAMETRES = ("ANNEE_DEBUT", "MACHINES", "MODULES_PAR_TYPE", "MODULES_PAR_MACHINE", "MACHINES_CLASSEMENT_PAR_NOM",
+              "CQH_REGEX", "CQM_REGEX", "CQS_REGEX", "JOURS_OUVRES", "JOURS_OUVRES_PAR_MACHINE",
+              "JOURS_FERIES", "FERMETURES_PAR_MACHINE")
+
+
+def signature_parametres():
+    return json.dumps({"schema": VERSION_SCHEMA, **{nom: getattr(config, nom) for nom in PARAMETRES}},
+                      sort_keys=True, default=sorted)
+
+
+class EtatsConformite(BaseSQLite):
+    def __init__(self, chemin=ETATS_DB, figeage_jours=ETATS_FIGEAGE_JOURS, calendrier=None, regles=None):
+        super().__init__(chemin)
+        self.figeage = timedelta(days=figeage_jours)
+        self.calendrier = calendrier or calendrier_defaut
+        self.regles = regles or regles_defaut
+        self._maj_lock = threading.Lock()
+        self._delta = LecteurDelta()
+        self._suivis = None          # {(type, id machine)} présents dans la table
+        self._materialise = set()    # {(type, id machine, année)} dont les périodes sont insérées
+        self._bornes = {}            # {(type, id machine, années): (débuts, fins) des périodes, triées}
+        self.mises_a_jour = 0
+        self.relectures = 0
+        self.cq_appliques = 0
+        self.duree_ms = None
+
+    def _creer_schema(self, conn):
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS etats_parametres (cle TEXT PRIMARY KEY, valeur TEXT)")
+            signature = signature_parametres()
+            stockee = conn.execute("SELECT valeur FROM etats_parametres WHERE cle = 'signature'").fetchone()
+            if stockee is None or stockee[0] != signature:
+                if stockee is not None:
+                    print("⚠️ États de conformité reconstruits : machines, règles ou calendrier modifiés")
+                conn.execute("DROP TABLE IF EXISTS etats_conformite")
+                conn.execute("DROP TABLE IF EXISTS compteurs_conformite")
+                conn.execute("INSERT OR REPLACE INTO etats_parametres (cle, valeur) VALUES ('signature', ?)", (signature,))
+            # cumul_* : conformes / jugées de la machine pour ce type jusqu'à cette période incluse (périodes figées)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS etats_conformite (
+                    type TEXT NOT NULL,
+                    machine INTEGER NOT NULL,
+                    debut DATE NOT NULL,
+                    fin DATE NOT NULL,
+                    annee INTEGER NOT NULL,
+                    periode TEXT NOT NULL,
+                    applicable INTEGER NOT NULL,
+                    etat TEXT NOT NULL,
+                    fait_le TEXT,
+                    id_etude INTEGER,
+                    fige INTEGER NOT NULL DEFAULT 0,
+                    cumul_conformes INTEGER,
+                    cumul_a_juger INTEGER,
+                    PRIMARY KEY (type, machine, debut)
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_etats_ouverts ON etats_conformite (fige, debut)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_etats_cumuls ON etats_conformite (type, machine, fige, fin)")
+            # Une ligne par (type, machine, année) matérialisée ; périodes figées seulement
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS compteurs_conformite (
+                    type TEXT NOT NULL,
+                    machine INTEGER NOT NULL,
+                    annee INTEGER NOT NULL,
+                    conformes INTEGER NOT NULL DEFAULT 0,
+                    a_juger INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (annee, type, machine)
+                )
+            ''')
+
+    # --- Mise à jour (processus qui porte le scheduler) ---
+
+    def _cq_realises(self, rows):
+        # {type: DataFrame (machine, jour, fait_le, id_etude)} des CQ des machines suivies
+        if rows.empty:
+            return {}
+        types = self.regles.classer_lignes(rows)
+        connues = rows["Id_Object"].isin(list(MACHINES)).to_numpy()
+        realises = {}
+        for typ in TYPES_CQ:
+            cq = rows[est_du_type(types, typ) & connues]
+            realises[typ] = cq.assign(
+                machine=cq["Id_Object"].astype(int),
+                jour=cq["StudyDate"].dt.date,
+                fait_le=cq["StudyDate"].dt.strftime("%Y-%m-%d %H:%M:%S"),
+                id_etude=cq["Id_ControleStudy"].astype(int),
+            )[["machine", "jour", "fait_le", "id_etude"]]
+        return realises
+
+    def _annees(self, today):
+        # Année suivante comprise : la semaine ISO 1 peut commencer fin décembre
+        return tuple(range(self.calendrier.annee_debut, today.year + 2))
+
+    def _materialiser(self, conn, realises, today):
+        # Insère les périodes des couples (type, machine) suivis ; renvoie les couples nouvellement suivis
+        if self._suivis is None:
+            self._suivis = set(conn.execute("SELECT DISTINCT type, machine FROM etats_conformite"))
+        # Comme les colonnes du dashboard : CQH pour toutes les machines, CQM / CQS dès le premier CQ du type
+        suivis = {("CQH", id_obj) for id_obj in MACHINES}
+        for typ in ("CQM", "CQS"):
+            if typ in realises:
+                suivis.update((typ, int(m)) for m in realises[typ]["machine"].unique())
+        nouveaux = suivis - self._suivis
+        for typ, id_obj in suivis | self._suivis:
+            for annee in self._annees(today):
+                if (typ, id_obj, annee) in self._materialise:
+                    continue
+                periodes = self.calendrier.periodes(typ, annee)
+                fins, applicables = self.calendrier.bornes(typ, annee, id_obj)
+                conn.executemany(
+                    "INSERT OR IGNORE INTO etats_conformite (type, machine, debut, fin, annee, periode, applicable, etat) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(typ, id_obj, debut.isoformat(), fin.item().isoformat(), annee, libelle, int(applicable),
+                      EN_COURS if applicable else NON_APPLICABLE)
+                     for debut, libelle, fin, applicable in zip(periodes["DateDebut"], periodes[LABELS_PAR_TYPE[typ][0]],
+                                                                fins, applicables)])
+                conn.execute("INSERT OR IGNORE INTO compteurs_conformite (type, machine, annee) VALUES (?, ?, ?)",
+                             (typ, id_obj, annee))
+                self._materialise.add((typ, id_obj, annee))
+        self._suivis |= suivis
+        return nouveaux
+
+    def _periodes_machine(self, typ, id_obj, annees):
+        cle = (typ, id_obj, annees)
+        if cle not in self._bornes:
+            import numpy as np
+            debuts = np.concatenate([self.calendrier.periodes(typ, a)["DateDebut"].values.astype("datetime64[D]")
+                                     for a in annees])
+            fins = np.concatenate([self.calendrier.bornes(typ, a, id_obj)[0] for a in annees])
+            self._bornes[cle] = (debuts, fins)
+        return self._bornes[cle]
+
+    def _appliquer(self, conn, realises, depuis, annees):
+        # Premier CQ de chaque période non figée : affectation par recherche dichotomique sur les débuts de période
+        import numpy as np
+        params = []
+        for typ, cq in realises.items():
+            cq = cq[cq["jour"] >= depuis]
+            for id_obj, lignes in cq.groupby("machine"):
+                if (typ, id_obj) not in self._suivis:
+                    continue
+                debuts, fins = self._periodes_machine(typ, id_obj, annees)
+                jours = lignes["jour"].values.astype("datetime64[D]")
+                idx = np.searchsorted(debuts, jours, side="right") - 1
+                ok = (idx >= 0) & (jours <= fins[np.clip(idx, 0, None)])
+                for i, fait_le, id_etude in zip(idx[ok], lignes["fait_le"].values[ok], lignes["id_etude"].values[ok]):
+                    params.append((fait_le, int(id_etude), typ, int(id_obj), str(debuts[i]), fait_le))
+        conn.executemany(
+            "UPDATE etats_conformite SET etat = ?, fait_le = ?, id_etude = ? "
+            "WHERE type = ? AND machine = ? AND debut = ? AND fige = 0 AND (fait_le IS NULL OR fait_le > ?)",
+            [(FAIT, *p) for p in params])
+        return len(params)
+
+    def _figer(self, conn, limite):
+        # Périodes terminées avant `limite` : état définitif (❌ si aucun CQ), compteurs annuels et cumuls
+        a_figer = conn.execute(
+            "SELECT type, machine, debut, annee, etat FROM etats_conformite WHERE fige = 0 AND fin < ? "
+            "ORDER BY type, machine, debut", (limite,)).fetchall()
+        cumuls, compteurs, lignes = {}, {}, []
+        for typ, id_obj, debut, annee, etat in a_figer:
+            if (typ, id_obj) not in cumuls:
+                cumuls[(typ, id_obj)] = conn.execute(
+                    "SELECT cumul_conformes, cumul_a_juger FROM etats_conformite "
+                    "WHERE type = ? AND machine = ? AND fige = 1 ORDER BY fin DESC LIMIT 1", (typ, id_obj)).fetchone() or (0, 0)
+            etat = EN_RETARD if etat == EN_COURS else etat
+            conforme, a_juger = int(etat == FAIT), int(etat in (FAIT, EN_RETARD))
+            cumul = (cumuls[(typ, id_obj)][0] + conforme, cumuls[(typ, id_obj)][1] + a_juger)
+            cumuls[(typ, id_obj)] = cumul
+            compte = compteurs.setdefault((typ, id_obj, annee), [0, 0])
+            compte[0] += conforme
+            compte[1] += a_juger
+            lignes.append((etat, *cumul, typ, id_obj, debut))
+        conn.executemany("UPDATE etats_conformite SET fige = 1, etat = ?, cumul_conformes = ?, cumul_a_juger = ? "
+                         "WHERE type = ? AND machine = ? AND debut = ?", lignes)
+        conn.executemany("UPDATE compteurs_conformite SET conformes = conformes + ?, a_juger = a_juger + ? "
+                         "WHERE type = ? AND machine = ? AND annee = ?",
+                         [(c, j, typ, id_obj, annee) for (typ, id_obj, annee), (c, j) in compteurs.items()])
+        return len(lignes)
+
+    def mettre_a_jour(self, rows, today=None):
+        # rows : extraction du cache, seules les études arrivées depuis la mise à jour précédente sont appliquées
+        today = today or date.today()
+        with self._maj_lock:
+            t0 = time.perf_counter()
+            conn = self._connexion()
+            nouvelles, relecture = self._delta.a_lire(rows)
+            realises = self._cq_realises(nouvelles)
+            annees = self._annees(today)
+            with conn:
+                nouveaux = self._materialiser(conn, realises, today)
+                if relecture:
+                    # Extraction remplacée (relecture complète, instantané) : périodes non figées recalculées
+                    conn.execute("UPDATE etats_conformite SET etat = CASE WHEN applicable THEN ? ELSE ? END, "
+                                 "fait_le = NULL, id_etude = NULL WHERE fige = 0", (EN_COURS, NON_APPLICABLE))
+                elif nouveaux:
+                    # Premier CQ d'un type pour une machine : toutes ses périodes sont calculées
+                    import pandas as pd
+                    complets = self._cq_realises(rows)
+                    realises = {typ: pd.concat([realises.get(typ), complets[typ][complets[typ]["machine"].isin(
+                                    [m for t, m in nouveaux if t == typ])]]) for typ in complets}
+                depuis = conn.execute("SELECT MIN(debut) FROM etats_conformite WHERE fige = 0").fetchone()[0]
+                appliques = self._appliquer(conn, realises, date.fromisoformat(depuis), annees) if depuis else 0
+                self._figer(conn, (today - self.figeage).isoformat())
+            self._delta.lu(rows)
+            with self._lock:
+                self.mises_a_jour += 1
+                self.relectures += relecture
+                self.cq_appliques += appliques
+                self.duree_ms = round((time.perf_counter() - t0) * 1000, 2)
+
+    # --- Lecture (tous les processus) ---
+
+    def _en_cours(self, conn, today, condition="", params=()):
+        # {(type, machine): [conformes, jugées]} des périodes pas encore figées, commencées ou déjà validées
+        # (étude datée dans le futur, comptée comme dans les tableaux du dashboard)
+        comptes = {}
+        for typ, id_obj, fin, etat in conn.execute(
+                "SELECT type, machine, fin, etat FROM etats_conformite WHERE fige = 0 AND (debut <= ? OR etat = ?)"
+                + condition, (today.isoformat(), FAIT, *params)):
+            compte = comptes.setdefault((typ, id_obj), [0, 0])
+            compte[0] += etat == FAIT
+            compte[1] += etat == FAIT or (etat == EN_COURS and fin < today.isoformat())
+        return comptes
+
+    @staticmethod
+    def _par_machine(comptes):
+        # {(type, machine): (conformes, jugées)} -> (machines, taux CQH, taux CQM, taux CQS), comme Conformite.taux
+        par_type = {typ: {} for typ in TYPES_CQ}
+        for (typ, id_obj), (conforme, a_juger) in comptes.items():
+            par_type[typ][MACHINES[id_obj][0]] = round((conforme / a_juger) * 100, 1) if a_juger > 0 else 100.0
+        machines = sorted(set().union(*par_type.values()))
+        return (machines, *({m: par_type[typ].get(m, 0.0) for m in machines} for typ in TYPES_CQ))
+
+    def taux(self, annee, today=None):
+        # Taux de l'année : compteurs des périodes figées + périodes en cours ; None si l'année n'est pas matérialisée
+        today = today or date.today()
+        conn = self._connexion()
+        comptes = {(typ, id_obj): [c, j] for typ, id_obj, c, j in conn.execute(
+            "SELECT type, machine, conformes, a_juger FROM compteurs_conformite WHERE annee = ?", (annee,))}
+        if not comptes:
+            return None
+        for cle, (c, j) in self._en_cours(conn, today, " AND annee = ?", (annee,)).items():
+            comptes[cle][0] += c
+            comptes[cle][1] += j
+        return self._par_machine(comptes)
+
+    def taux_glissants(self, semaines, today=None):
+        # Taux sur les périodes terminées dans les `semaines` dernières semaines ou en cours : différence de deux cumuls
+        # (lus par index) par machine + périodes en cours ; None si la table n'est pas construite
+        today = today or date.today()
+        debut = (today - timedelta(weeks=semaines)).isoformat()
+        conn = self._connexion()
+        couples = conn.execute("SELECT type, machine FROM compteurs_conformite WHERE annee = ?", (today.year,)).fetchall()
+        if not couples:
+            return None
+        requete = ("SELECT cumul_conformes, cumul_a_juger FROM etats_conformite "
+                   "WHERE type = ? AND machine = ? AND fige = 1{} ORDER BY fin DESC LIMIT 1")
+        comptes = {}
+        for typ, id_obj in couples:
+            dernier = conn.execute(requete.format(""), (typ, id_obj)).fetchone() or (0, 0)
+            avant = conn.execute(requete.format(" AND fin < ?"), (typ, id_obj, debut)).fetchone() or (0, 0)
+            comptes[(typ, id_obj)] = [dernier[0] - avant[0], dernier[1] - avant[1]]
+        for cle, (c, j) in self._en_cours(conn, today, " AND fin >= ?", (debut,)).items():
+            comptes[cle][0] += c
+            comptes[cle][1] += j
+        return self._par_machine(comptes)
+
+    def taux_fenetres(self, today=None):
+        # {semaines: (machines, taux CQH, taux CQM, taux CQS)} pour chaque fenêtre de TAUX_GLISSANTS_SEMAINES
+        return {semaines: self.taux_glissants(semaines, today) for semaines in TAUX_GLISSANTS_SEMAINES}
+
+    def stats(self):
+        conn = self._connexion()
+        lignes, figees = conn.execute("SELECT COUNT(*), COALESCE(SUM(fige), 0) FROM etats_conformite").fetchone()
+        with self._lock:
+            return {"periodes": lignes, "figees": figees, "mises_a_jour": self.mises_a_jour,
+                    "relectures": self.relectures, "cq_appliques": self.cq_appliques, "duree_ms": self.duree_ms}
@@ -0,0 +1,193 @@
+# Export CSV / XLSX en flux : les lignes sont produites par des générateurs (tableaux de conformité année par année,
+# études de l'extraction par blocs) et envoyées au fil de l'eau, le fichier n'est jamais construit en mémoire
+# XLSX écrit sans dépendance : archive zip produite en flux, feuille SpreadsheetML minimale (chaînes en ligne)
+import csv
+import io
+import numbers
+import re
+import zipfile
+from datetime import date, datetime
+from itertools import chain
+from xml.sax.saxutils import escape
+
+from config import MACHINES
+from cq_commun import LABELS_PAR_TYPE
+from cq_regles import regles as regles_defaut, TYPES_CQ, BITS
+
+# Taille des morceaux envoyés au client
+TAILLE_MORCEAU = 64 * 1024
+# Études lues (et classées) par bloc pour l'export brut
+TAILLE_BLOC = 5000
+
+COLONNES_ETUDES = ["Id_ControleStudy", "Id_Object", "Id_UserModule", "Name", "StudyDate"]
+CARACTERES_INVALIDES_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def texte(valeur):
+    if valeur is None or (isinstance(valeur, float) and valeur != valeur):
+        return ""
+    if isinstance(valeur, datetime):
+        return valeur.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(valeur, date):
+        return valeur.isoformat()
+    return str(valeur)
+
+
+def liens_export(calendrier, annee):
+    # Paramètres des boutons d'export du dashboard : périodes de l'année affichée (semaines ISO de l'année pour les CQH)
+    liens = {}
+    for typ in TYPES_CQ:
+        periodes = calendrier.periodes(typ, annee)
+        liens[typ.lower()] = f"from={periodes['DateDebut'].min()}&to={periodes['DateFin'].max()}"
+    return liens
+
+
+# --- Sources de lignes : (entêtes, générateur de lignes) ---
+
+def lignes_tableau(conformite, typ, debut=None, fin=None, avec_dates=True):
+    # Tableau de conformité du dashboard (calcul partagé), périodes qui chevauchent [debut, fin], année par année
+    # avec_dates : colonnes Debut / Fin de chaque période après les libellés (absentes de l'ancien export CQH)
+    labels = LABELS_PAR_TYPE[typ]
+    dates = ["Debut", "Fin"] if avec_dates else []
+    entetes = [*labels, *dates, *(nom for _, nom, _ in conformite.colonnes[typ])]
+
+    def lignes():
+        for annee in conformite.annees():
+            periodes = conformite.calendrier.periodes(typ, annee)
+            bornes = list(zip(periodes["DateDebut"], periodes["DateFin"]))
+            garde = [(debut is None or f >= debut) and (fin is None or d <= fin) for d, f in bornes]
+            if not any(garde):
+                continue
+            tableau = conformite.tableau(typ, annee)
+            for g, (d, f), ligne in zip(garde, bornes, tableau.itertuples(index=False, name=None)):
+                if g:
+                    yield (*ligne[:len(labels)], *((d, f) if avec_dates else ()), *ligne[len(labels):])
+
+    return entetes, lignes()
+
+
+def lignes_etudes(rows, debut=None, fin=None, regles=None):
+    # Études de l'extraction (machines suivies, modules CQ) entre debut et fin inclus, par date, avec leur type de CQ
+    import numpy as np
+    regles = regles or regles_defaut
+    entetes = ["Id_ControleStudy", "Id_Object", "Machine", "Id_UserModule", "Name", "StudyDate", "Type"]
+    jours = rows["StudyDate"].values.astype("datetime64[D]")
+    garde = np.ones(len(rows), dtype=bool)
+    if debut is not None:
+        garde &= jours >= np.datetime64(debut, "D")
+    if fin is not None:
+        garde &= jours <= np.datetime64(fin, "D")
+    indices = np.flatnonzero(garde)
+    indices = indices[np.argsort(rows["StudyDate"].values[indices], kind="stable")]
+
+    def lignes():
+        for i in range(0, len(indices), TAILLE_BLOC):
+            bloc = rows.iloc[indices[i:i + TAILLE_BLOC]]
+            types = regles.classer_lignes(bloc)
+            for (id_etude, id_obj, module, nom, jour), bits in zip(
+                    bloc[COLONNES_ETUDES].itertuples(index=False, name=None), types):
+                yield (id_etude, id_obj, MACHINES.get(id_obj, ("",))[0], module, nom, jour,
+                       "+".join(typ for typ in TYPES_CQ if bits & BITS[typ]))
+
+    return entetes, lignes()
+
+
+# --- Formats ---
+
+def flux_csv(entetes, lignes, sep=";"):
+    # UTF-8 avec BOM et ";" : ouverture directe dans Excel (même format que l'ancien export pandas)
+    tampon = io.StringIO()
+    ecrivain = csv.writer(tampon, delimiter=sep, lineterminator="\n")
+    tampon.write("\ufeff")
+    for ligne in chain([entetes], lignes):
+        ecrivain.writerow([texte(v) for v in ligne])
+        if tampon.tell() > TAILLE_MORCEAU:
+            yield tampon.getvalue().encode("utf-8")
+            tampon.seek(0)
+            tampon.truncate()
+    yield tampon.getvalue().encode("utf-8")
+
+
+class _SortieFlux:
+    # Fichier en écriture seule, non positionnable : zipfile écrit alors l'archive en flux (descripteurs de données)
+    def __init__(self):
+        self.morceaux = []
+        self.taille = 0
+
+    def write(self, data):
+        self.morceaux.append(bytes(data))
+        self.taille += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def vider(self):
+        data = b"".join(self.morceaux)
+        self.morceaux, self.taille = [], 0
+        return data
+
+
+def _colonne(i):
+    # 0 -> A, 25 -> Z, 26 -> AA
+    lettres = ""
+    i += 1
+    while i:
+        i, reste = divmod(i - 1, 26)
+        lettres = chr(65 + reste) + lettres
+    return lettres
+
+
+def _cellule(ref, valeur):
+    if isinstance(valeur, numbers.Real) and not isinstance(valeur, bool) and valeur == valeur:
+        return f'<c r="{ref}"><v>{valeur}</v></c>'
+    return f'<c r="{ref}" t="inlineStr"><is><t>{escape(CARACTERES_INVALIDES_XML.sub("", texte(valeur)))}</t></is></c>'
+
+
+XLSX_PARTIES = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="{feuille}" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+}
+
+
+def flux_xlsx(entetes, lignes, feuille="Export"):
+    sortie = _SortieFlux()
+    with zipfile.ZipFile(sortie, "w", zipfile.ZIP_DEFLATED) as archive:
+        for nom, contenu in XLSX_PARTIES.items():
+            archive.writestr(nom, contenu.replace("{feuille}", escape(feuille[:31])))
+        with archive.open("xl/worksheets/sheet1.xml", "w") as feuille_xml:
+            feuille_xml.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                              b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                              b'<sheetData>')
+            for r, ligne in enumerate(chain([entetes], lignes), 1):
+                cellules = "".join(_cellule(f"{_colonne(i)}{r}", v) for i, v in enumerate(ligne))
+                feuille_xml.write(f'<row r="{r}">{cellules}</row>'.encode("utf-8"))
+                if sortie.taille > TAILLE_MORCEAU:
+                    yield sortie.vider()
+            feuille_xml.write(b"</sheetData></worksheet>")
+    yield sortie.vider()
@@ -0,0 +1,154 @@
+# Notifications Teams : file d'attente persistante (SQLite), envoi en arrière-plan par une session HTTP réutilisée
+# avec délais d'attente, renvoi à délai croissant en cas d'échec, et dédoublonnage (une alerte par machine et période)
+import json
+import threading
+import time
+
+from config import (WEBHOOK_URL, NOTIFICATIONS_DB, TEAMS_TIMEOUT_SECONDES, TEAMS_ESSAIS_MAX,
+                    TEAMS_DELAI_INITIAL_SECONDES, TEAMS_DELAI_MAX_SECONDES, TEAMS_VERIFIER_CERTIFICAT)
+from cq_commun import BaseSQLite
+
+
+class DispatcheurTeams(BaseSQLite):
+    def __init__(self, url=WEBHOOK_URL, chemin=NOTIFICATIONS_DB, timeout=TEAMS_TIMEOUT_SECONDES,
+                 essais_max=TEAMS_ESSAIS_MAX, delai_initial=TEAMS_DELAI_INITIAL_SECONDES,
+                 delai_max=TEAMS_DELAI_MAX_SECONDES, verifier_certificat=TEAMS_VERIFIER_CERTIFICAT):
+        super().__init__(chemin)
+        self.url = url
+        self.timeout = tuple(timeout)
+        self.essais_max = essais_max
+        self.delai_initial = delai_initial
+        self.delai_max = delai_max
+        self.verifier_certificat = verifier_certificat
+        self._reveil = threading.Event()
+        self._thread = None
+        self._session = None
+        self.envoyes = 0
+        self.echecs = 0
+        self.doublons = 0
+
+    def _creer_schema(self, conn):
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS notifications (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    payload TEXT NOT NULL,
+                    cree_le REAL NOT NULL,
+                    essais INTEGER NOT NULL DEFAULT 0,
+                    prochain_essai REAL NOT NULL,
+                    envoye_le REAL,
+                    abandonne INTEGER NOT NULL DEFAULT 0,
+                    derniere_erreur TEXT
+                )
+            ''')
+            # Clés de dédoublonnage (ex : "CQH|2025-S12|NOVALIS") : une seule notification par clé
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS notifications_cles (
+                    cle TEXT PRIMARY KEY,
+                    id_notification INTEGER NOT NULL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_notifications_a_envoyer "
+                         "ON notifications (envoye_le, abandonne, prochain_essai)")
+
+    # --- File d'attente ---
+
+    @staticmethod
+    def _cles_connues(conn, cles):
+        return {ligne[0] for ligne in conn.execute(
+            f"SELECT cle FROM notifications_cles WHERE cle IN ({', '.join('?' * len(cles))})", cles)}
+
+    def nouvelles_cles(self, cles):
+        # Clés pas encore notifiées (dans l'ordre reçu)
+        cles = list(cles)
+        if not cles:
+            return []
+        connues = self._cles_connues(self._connexion(), cles)
+        return [cle for cle in cles if cle not in connues]
+
+    def enfiler(self, payload, cles=()):
+        # Enregistre la notification (envoyée en arrière-plan) ; None si toutes ses clés ont déjà été notifiées
+        cles = list(cles)
+        conn = self._connexion()
+        with conn:
+            if cles and len(self._cles_connues(conn, cles)) == len(set(cles)):
+                with self._lock:
+                    self.doublons += 1
+                return None
+            now = time.time()
+            id_ = conn.execute("INSERT INTO notifications (payload, cree_le, prochain_essai) VALUES (?, ?, ?)",
+                               (json.dumps(payload, ensure_ascii=False), now, now)).lastrowid
+            conn.executemany("INSERT OR IGNORE INTO notifications_cles (cle, id_notification) VALUES (?, ?)",
+                             [(cle, id_) for cle in cles])
+        self._reveil.set()
+        return id_
+
+    # --- Envoi ---
+
+    def _poster(self, payload):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        r = self._session.post(self.url, data=payload.encode("utf-8"),
+                               headers={"Content-Type": "application/json"},
+                               timeout=self.timeout, verify=self.verifier_certificat)
+        if not 200 <= r.status_code < 300:
+            raise RuntimeError(f"HTTP {r.status_code} : {r.text[:200]}")
+
+    def envoyer_en_attente(self):
+        # Envoie les notifications arrivées à échéance ; renvoie le délai (s) avant la prochaine échéance, ou None
+        conn = self._connexion()
+        dues = conn.execute(
+            "SELECT id, payload, essais FROM notifications "
+            "WHERE envoye_le IS NULL AND abandonne = 0 AND prochain_essai <= ? ORDER BY id",
+            (time.time(),)).fetchall()
+        for id_, payload, essais in dues:
+            try:
+                self._poster(payload)
+            except Exception as e:
+                essais += 1
+                abandonne = int(essais >= self.essais_max)
+                delai = min(self.delai_max, self.delai_initial * 2 ** (essais - 1))
+                with conn:
+                    conn.execute("UPDATE notifications SET essais = ?, prochain_essai = ?, abandonne = ?, "
+                                 "derniere_erreur = ? WHERE id = ?",
+                                 (essais, time.time() + delai, abandonne, str(e), id_))
+                with self._lock:
+                    self.echecs += 1
+                print(f"❌ Notification Teams {id_} (essai {essais}/{self.essais_max}) : {e}"
+                      + (" — abandon" if abandonne else f" — nouvel essai dans {delai:.0f} s"))
+                continue
+            with conn:
+                conn.execute("UPDATE notifications SET essais = ?, envoye_le = ?, derniere_erreur = NULL "
+                             "WHERE id = ?", (essais + 1, time.time(), id_))
+            with self._lock:
+                self.envoyes += 1
+            print(f"✅ Notification Teams {id_} envoyée")
+        prochaine = conn.execute("SELECT MIN(prochain_essai) FROM notifications "
+                                 "WHERE envoye_le IS NULL AND abandonne = 0").fetchone()[0]
+        return None if prochaine is None else max(0.0, prochaine - time.time())
+
+    def _boucle(self):
+        while True:
+            try:
+                attente = self.envoyer_en_attente()
+            except Exception as e:
+                print(f"❌ Erreur file de notifications : {e}")
+                attente = self.delai_initial
+            self._reveil.wait(timeout=attente)
+            self._reveil.clear()
+
+    def demarrer(self):
+        # Thread d'envoi (processus qui porte le scheduler) : reprend aussi les notifications en attente au redémarrage
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._boucle, name="notifications-teams", daemon=True)
+                self._thread.start()
+
+    def stats(self):
+        en_attente, abandonnees = self._connexion().execute(
+            "SELECT COALESCE(SUM(envoye_le IS NULL AND abandonne = 0), 0), COALESCE(SUM(abandonne), 0) "
+            "FROM notifications").fetchone()
+        with self._lock:
+            return {"envoyees": self.envoyes, "echecs": self.echecs, "doublons": self.doublons,
+                    "en_attente": en_attente, "abandonnees": abandonnees, "actif": self._thread is not None}
@@ -0,0 +1,89 @@
+# Règles de classification des études Artiscan en CQH / CQM / CQS, construites une fois depuis config.py
+# Chaque triplet (Id_Object, Id_UserModule, Name) distinct n'est classé qu'une seule fois (mémoïsation)
+# numpy / pandas ne sont importés que pour classer un extrait : le module reste léger à l'import
+import re
+import threading
+
+from config import (MODULES_PAR_TYPE, CQH_REGEX, CQM_REGEX, CQS_REGEX,
+                    MACHINES_CLASSEMENT_PAR_NOM, MODULES_PAR_MACHINE)
+
+TYPES_CQ = ("CQH", "CQM", "CQS")
+BITS = {"CQH": 1, "CQM": 2, "CQS": 4}
+COLONNES_CLE = ["Id_Object", "Id_UserModule", "Name"]
+
+
+class ReglesClassification:
+    def __init__(self, modules_par_type=MODULES_PAR_TYPE, regex_par_type=None,
+                 machines_par_nom=MACHINES_CLASSEMENT_PAR_NOM, modules_par_machine=MODULES_PAR_MACHINE):
+        regex_par_type = regex_par_type or {"CQH": CQH_REGEX, "CQM": CQM_REGEX, "CQS": CQS_REGEX}
+        self.regex = {typ: re.compile(rx) for typ, rx in regex_par_type.items()}
+        self.modules_par_type = {typ: frozenset(ids) for typ, ids in modules_par_type.items()}
+        self.modules_par_machine = {
+            id_obj: {typ: frozenset(ids) for typ, ids in modules.items()}
+            for id_obj, modules in modules_par_machine.items()
+        }
+        self.machines_par_nom = frozenset(machines_par_nom)
+        self._lock = threading.Lock()
+        self._memo = {}
+        self.hits = 0
+        self.misses = 0
+        self.lignes = 0
+
+    def modules(self, typ, id_obj=None):
+        return self.modules_par_machine.get(id_obj, {}).get(typ, self.modules_par_type.get(typ, frozenset()))
+
+    def tous_modules(self):
+        # Modules à extraire d'Artiscan pour les machines classées par module (filtre SQL)
+        modules = set().union(*self.modules_par_type.values())
+        for modules_machine in self.modules_par_machine.values():
+            modules.update(*modules_machine.values())
+        return modules
+
+    def _classer(self, id_obj, module_id, name):
+        # Entier à bits (BITS) : une étude peut en théorie correspondre à plusieurs types par son nom
+        bits = 0
+        for typ in TYPES_CQ:
+            if id_obj in self.machines_par_nom:
+                ok = typ in self.regex and bool(self.regex[typ].search(name))
+            else:
+                ok = module_id in self.modules(typ, id_obj)
+            if ok:
+                bits |= BITS[typ]
+        return bits
+
+    def classer(self, id_obj, module_id, name):
+        cle = (id_obj, module_id, name)
+        with self._lock:
+            bits = self._memo.get(cle)
+            if bits is not None:
+                self.hits += 1
+                return bits
+            self.misses += 1
+        bits = self._classer(id_obj, module_id, name)
+        with self._lock:
+            self._memo[cle] = bits
+        return bits
+
+    def classer_lignes(self, rows):
+        # Types (entiers à bits) de chaque ligne : classement des seuls triplets distincts, puis diffusion aux lignes
+        import numpy as np
+        import pandas as pd
+        if rows.empty:
+            return np.zeros(0, dtype=np.int64)
+        cles = rows[COLONNES_CLE].astype({"Name": str})
+        codes, uniques = pd.MultiIndex.from_frame(cles).factorize()
+        types = np.array([self.classer(i, m, n) for i, m, n in uniques], dtype=np.int64)
+        with self._lock:
+            self.lignes += len(rows)
+        return types[codes]
+
+    def stats(self):
+        with self._lock:
+            return {"triplets": len(self._memo), "lignes_classees": self.lignes, "hits": self.hits, "misses": self.misses}
+
+
+def est_du_type(types, typ):
+    return (types & BITS[typ]) != 0
+
+
+regles = ReglesClassification()
@@ -1,1317 +1,928 @@
-
 import getpass
-from flask import Flask, jsonify, render_template_string, request, make_response
-import pyodbc
-from collections import defaultdict
-from datetime import datetime, timedelta, date
-import re
-import pandas as pd
-from apscheduler.schedulers.background import BackgroundScheduler
-import requests
-import urllib3
-import io
+from flask import Flask, jsonify, render_template, request
+from jinja2 import FileSystemBytecodeCache
+from datetime import datetime, date
+import importlib.util
+import threading
+import time
+import queue
+import os
+import json
+import hashlib
+import gzip
+import zlib
 import sqlite3
+import sys
+from contextlib import contextmanager
+
+# Modules lourds (pandas, cq_conformite qui en dépend, pyodbc, pyarrow, APScheduler, requests)
+# importés à la première utilisation : l'import du module reste rapide (redémarrage du service, workers, benchmarks)
+
+try:
+    # Optionnel : compression brotli des réponses (gzip sinon)
+    import brotli
+except ImportError:
+    brotli = None
+
+from cq_regles import regles, est_du_type, TYPES_CQ
+from cq_calendrier import calendrier
+from cq_commentaires import StockCommentaires
+from cq_notifications import DispatcheurTeams
+from cq_alertes import MoteurAlertes
+from cq_etats import EtatsConformite
+from cq_export import lignes_tableau, lignes_etudes, flux_csv, flux_xlsx, liens_export
 
 # Importer la config générale (machines, regex, etc.)
-from config import SQL_CONFIG, MACHINES, EXCLUSION_REGEX, CQM_REGEX, CQH_REGEX, CQS_REGEX, MODULES_PAR_TYPE, WEBHOOK_URL, COMMENT_DB
+from config import SQL_ENV_UTILISATEUR, SQL_ENV_MOT_DE_PASSE, SQL_FICHIER_IDENTIFIANTS, SQL_KEYRING_SERVICE
+from config import SQL_CONFIG, MACHINES, COMMENT_DB, CACHE_TTL_SECONDES, RECONCILIATION_COMPLETE_SECONDES, POOL_TAILLE, POOL_ATTENTE_MAX_SECONDES, INSTANTANE_LOCAL
+from config import SERVE_HOTE, SERVE_PORT, SERVE_THREADS, SERVE_WORKERS, SCHEDULER_VERROU, ALERTES_INTERVALLE_SECONDES
+
+# Identifiants SQL : lus à la première connexion (variables d'environnement, fichier protégé, trousseau),
+# l'import du module ne demande rien et ne se connecte à rien
+_identifiants = None
+_identifiants_lock = threading.Lock()
+
+
+def lire_fichier_identifiants(chemin):
+    if not chemin or not os.path.exists(chemin):
+        return None, None
+    if os.name != "nt" and os.stat(chemin).st_mode & 0o077:
+        print(f"⚠️ {chemin} ignoré : accessible à d'autres comptes (chmod 600 {chemin})")
+        return None, None
+    with open(chemin, encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("utilisateur"), data.get("mot_de_passe")
 
-# Demande des identifiants SQL à l'exécution
-print("=== Authentification SQL ===")
-username = input("Entrez l'identifiant SQL : ")
-password = getpass.getpass("Entrez le mot de passe SQL : ")
 
-# Connexion SQL
-conn_str = f"DRIVER={{SQL Server}};SERVER={SQL_CONFIG['server']};DATABASE={SQL_CONFIG['database']};UID={username};PWD={password}"
+def mot_de_passe_keyring(utilisateur):
+    try:
+        import keyring
+    except ImportError:
+        return None
+    try:
+        return keyring.get_password(SQL_KEYRING_SERVICE, utilisateur)
+    except Exception as e:
+        print(f"⚠️ Trousseau inaccessible : {e}")
+        return None
+
+
+def identifiants_sql(interactif=False):
+    # (utilisateur, mot de passe), résolus une seule fois ; la saisie au clavier n'est proposée qu'au lancement
+    # depuis une console (interactif=True)
+    global _identifiants
+    with _identifiants_lock:
+        if _identifiants is not None:
+            return _identifiants
+        utilisateur = os.environ.get(SQL_ENV_UTILISATEUR)
+        mot_de_passe = os.environ.get(SQL_ENV_MOT_DE_PASSE)
+        if not (utilisateur and mot_de_passe):
+            fichier_utilisateur, fichier_mot_de_passe = lire_fichier_identifiants(SQL_FICHIER_IDENTIFIANTS)
+            utilisateur = utilisateur or fichier_utilisateur
+            mot_de_passe = mot_de_passe or fichier_mot_de_passe
+        if utilisateur and not mot_de_passe:
+            mot_de_passe = mot_de_passe_keyring(utilisateur)
+        if not (utilisateur and mot_de_passe) and interactif and sys.stdin.isatty():
+            print("=== Authentification SQL ===")
+            utilisateur = utilisateur or input("Entrez l'identifiant SQL : ")
+            mot_de_passe = mot_de_passe or getpass.getpass("Entrez le mot de passe SQL : ")
+        if not (utilisateur and mot_de_passe):
+            raise RuntimeError(f"Identifiants SQL introuvables ({SQL_ENV_UTILISATEUR} / {SQL_ENV_MOT_DE_PASSE}, "
+                               f"{SQL_FICHIER_IDENTIFIANTS} ou trousseau '{SQL_KEYRING_SERVICE}')")
+        _identifiants = (utilisateur, mot_de_passe)
+        return _identifiants
+
+
+def chaine_connexion():
+    username, password = identifiants_sql()
+    return f"DRIVER={{SQL Server}};SERVER={SQL_CONFIG['server']};DATABASE={SQL_CONFIG['database']};UID={username};PWD={password}"
+
 
 app = Flask(__name__)
+# Templates (dossier templates/) compilés une seule fois par processus, bytecode également mis en cache sur disque
+# pour les redémarrages
+app.jinja_options = {**app.jinja_options, "bytecode_cache": FileSystemBytecodeCache()}
+
+
+class PoolConnexions:
+    # Pool borné de connexions pyodbc : la connexion au serveur SQL coûte plus cher que nos requêtes.
+    # Chaque connexion est testée avant usage (redémarrage du serveur, coupure réseau) et recréée si besoin.
+    def __init__(self, connecter, taille, attente_max, requete_test="SELECT 1"):
+        self.connecter = connecter
+        self.taille = taille
+        self.attente_max = attente_max
+        self.requete_test = requete_test
+        self._places = threading.BoundedSemaphore(taille)
+        self._libres = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.emprunts = 0
+        self.attente_totale = 0.0
+        self.attente_max_observee = 0.0
+        self.timeouts = 0
+        self.creees = 0
+        self.invalides = 0
+        self.en_cours = 0
+
+    def _valide(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.requete_test)
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _fermer(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _obtenir(self):
+        while True:
+            try:
+                conn = self._libres.get_nowait()
+            except queue.Empty:
+                break
+            if self._valide(conn):
+                return conn
+            with self._lock:
+                self.invalides += 1
+            self._fermer(conn)
+        conn = self.connecter()
+        with self._lock:
+            self.creees += 1
+        return conn
+
+    @contextmanager
+    def connexion(self):
+        debut = time.monotonic()
+        if not self._places.acquire(timeout=self.attente_max):
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"Aucune connexion SQL libre après {self.attente_max} s")
+        attente = time.monotonic() - debut
+        with self._lock:
+            self.emprunts += 1
+            self.en_cours += 1
+            self.attente_totale += attente
+            self.attente_max_observee = max(self.attente_max_observee, attente)
+
+        conn = None
+        try:
+            conn = self._obtenir()
+            yield conn
+        except Exception:
+            # Connexion dans un état inconnu après une erreur : on ne la remet pas dans le pool
+            if conn is not None:
+                self._fermer(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._libres.put(conn)
+            with self._lock:
+                self.en_cours -= 1
+            self._places.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "taille": self.taille,
+                "en_cours": self.en_cours,
+                "libres": self._libres.qsize(),
+                "emprunts": self.emprunts,
+                "attente_moyenne_ms": round(self.attente_totale / self.emprunts * 1000, 2) if self.emprunts else 0.0,
+                "attente_max_ms": round(self.attente_max_observee * 1000, 2),
+                "timeouts": self.timeouts,
+                "connexions_creees": self.creees,
+                "connexions_invalides": self.invalides,
+            }
 
-# Base de données commentaires légère sous forme de fichier pour justifier si il y a un non-conformité de périodicité sur un contrôle
-def init_commentaires_db():
-    conn = sqlite3.connect(COMMENT_DB)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS commentaires (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            machine TEXT,
-            semaine TEXT,
-            commentaire TEXT,
-            auteur TEXT,
-            date_commentaire DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-init_commentaires_db()
-
-def get_commentaires():
-    conn = sqlite3.connect("commentaires_cq.db")
-    c = conn.cursor()
-    c.execute("SELECT machine, semaine, commentaire, auteur, date_commentaire FROM commentaires")
-    data = c.fetchall()
-    conn.close()
-    # Indexation rapide par (machine, semaine)
-    return {(row[0], row[1]): {"commentaire": row[2], "auteur": row[3], "date": row[4]} for row in data}
-
-
-def get_taux_conformite(annee=2025):
-    # 1. Génère les périodes de référence comme dans /cq_dashboard
-    today = date.today()
-    # Générer les semaines complètes pour 2024 et 2025 (lundi-vendredi)
-    semaines = []
-    current = date(2023, 12, 25)  # pour être sûr d'inclure S1 de 2024
-    current -= timedelta(days=current.weekday())
-    while current.year < 2026:
-        y, w, _ = current.isocalendar()
-        if y >= 2024:
-            semaines.append({
-                "Semaine": f"S{w}",
-                "DateDebut": current,
-                "DateFin": current + timedelta(days=4)
-            })
-        current += timedelta(weeks=1)
-    df_semaines = pd.DataFrame(semaines)
-
-
-    # Mois CQM
-    mois = []
-    for y in (2024, 2025):
-        for m in range(1, 13):
-            mois.append({
-                "Mois": f"{datetime(y, m, 1).strftime('%B').capitalize()} {y}",
-                "DateDebut": datetime(y, m, 1).date(),
-                "DateFin": (datetime(y, m + 1, 1) - timedelta(days=1)).date() if m < 12 else date(y, 12, 31)
-            })
-    df_mois = pd.DataFrame(mois)
 
+# Lecture seule : autocommit pour ne pas garder de transaction ouverte sur les connexions du pool
+def connecter_sql():
+    import pyodbc
+    return pyodbc.connect(chaine_connexion(), timeout=5, autocommit=True)
 
-    # Semestres CQS
-    semestres = [
-        {"Semestre": "S1 2024", "DateDebut": date(2024, 1, 1), "DateFin": date(2024, 6, 30), "Year": 2024},
-        {"Semestre": "S2 2024", "DateDebut": date(2024, 7, 1), "DateFin": date(2024, 12, 31), "Year": 2024},
-        {"Semestre": "S1 2025", "DateDebut": date(2025, 1, 1), "DateFin": date(2025, 6, 30), "Year": 2025},
-        {"Semestre": "S2 2025", "DateDebut": date(2025, 7, 1), "DateFin": date(2025, 12, 31), "Year": 2025},
-    ]
-    df_semestres = pd.DataFrame(semestres)
 
-   
+pool_sql = PoolConnexions(connecter_sql, POOL_TAILLE, POOL_ATTENTE_MAX_SECONDES)
 
-    # 2. Récupère les résultats CQ
-    try:
-        conn = pyodbc.connect(conn_str, timeout=5)
-        rows = pd.read_sql("""
-            SELECT cs.Id_Object, cs.Id_UserModule, cs.Name, cs.StudyDate
-            FROM CONTROLE_STUDY cs
-            JOIN RESULT r ON cs.Id_ControleStudy = r.Id_ControleStudy
-            WHERE cs.StudyDate IS NOT NULL
-        """, conn)
-        conn.close()
-    except Exception as e:
-        print(f"Erreur SQL : {e}")
-        return [], {}, {}, {}
 
+# Extraction des CQ réalisés, partagée par toutes les routes et la tâche d'alerte
+# Une ligne par étude ayant au moins un résultat : semi-jointure EXISTS plutôt qu'une jointure
+# qui renverrait l'étude autant de fois qu'elle a de résultats
+EXISTE_RESULTAT = "EXISTS (SELECT 1 FROM RESULT r WHERE r.Id_ControleStudy = cs.Id_ControleStudy)"
+
+REQUETE_CQ = f"""
+    SELECT cs.Id_ControleStudy, cs.Id_Object, cs.Id_UserModule, cs.Name, cs.StudyDate
+    FROM CONTROLE_STUDY cs
+    WHERE cs.StudyDate IS NOT NULL
+      AND {EXISTE_RESULTAT}
+"""
+
+def marqueurs(valeurs):
+    # "?, ?, ?" pour une clause IN paramétrée
+    return ", ".join("?" * len(valeurs))
+
+
+def filtre_extraction_cq():
+    # Filtre poussé côté SQL : seules les études utiles au calcul de conformité sont transférées
+    # (machines suivies, modules CQ configurés ou machines classées par nom, période suivie)
+    machines = sorted(MACHINES)
+    modules = sorted(regles.tous_modules())
+    par_nom = sorted(regles.machines_par_nom & set(machines))
+
+    condition = f" AND cs.StudyDate >= ? AND cs.Id_Object IN ({marqueurs(machines)})"
+    params = [calendrier.debut_suivi(), *machines]
+    types = [f"cs.Id_UserModule IN ({marqueurs(modules)})"]
+    params += modules
+    if par_nom:
+        types.append(f"cs.Id_Object IN ({marqueurs(par_nom)})")
+        params += par_nom
+    condition += " AND (" + " OR ".join(types) + ")"
+    return condition, params
+
+
+def charger_extraction_cq(condition="", params=None):
+    import pandas as pd
+    filtre, params_filtre = filtre_extraction_cq()
+    with pool_sql.connexion() as conn:
+        rows = pd.read_sql(REQUETE_CQ + filtre + condition, conn, params=params_filtre + list(params or []))
     rows['StudyDate'] = pd.to_datetime(rows['StudyDate'])
+    return rows
+
+
+class InstantaneLocal:
+    # Copie locale (Feather / Arrow IPC) de l'extraction et de son high-water mark :
+    # redémarrage à chaud et site consultable (lecture seule) pendant une maintenance du serveur SQL
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self.actif = bool(chemin) and importlib.util.find_spec("pyarrow") is not None
+        self.lectures = 0
+        self.ecritures = 0
+        self.erreurs = 0
+        self.derniere_ecriture = None
+        self.lu_modification = None
+        if chemin and not self.actif:
+            print("⚠️ pyarrow non installé : instantané local désactivé")
+
+    def modification(self):
+        try:
+            return os.stat(self.chemin).st_mtime_ns
+        except OSError:
+            return None
+
+    def lire(self, signature):
+        # (rows, meta), ou (None, None) si absent, illisible ou extrait avec un autre filtre
+        if not self.actif or not os.path.exists(self.chemin):
+            return None, None
+        self.lu_modification = self.modification()
+        import pyarrow.feather as feather
+        try:
+            table = feather.read_table(self.chemin, memory_map=True)
+            meta = json.loads(table.schema.metadata[b"cq_meta"])
+            if meta.get("signature") != signature:
+                print("⚠️ Instantané local ignoré : filtre d'extraction modifié depuis son écriture")
+                return None, None
+            rows = table.to_pandas()
+        except Exception as e:
+            self.erreurs += 1
+            print(f"❌ Erreur lecture instantané local : {e}")
+            return None, None
+        self.lectures += 1
+        return rows, meta
+
+    def ecrire(self, rows, meta):
+        # Écriture dans un fichier temporaire puis renommage : jamais de fichier à moitié écrit
+        if not self.actif:
+            return
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        try:
+            table = pa.Table.from_pandas(rows, preserve_index=False)
+            metadata = dict(table.schema.metadata or {})
+            metadata[b"cq_meta"] = json.dumps(meta).encode()
+            tmp = self.chemin + ".tmp"
+            feather.write_feather(table.replace_schema_metadata(metadata), tmp)
+            os.replace(tmp, self.chemin)
+        except Exception as e:
+            self.erreurs += 1
+            print(f"❌ Erreur écriture instantané local : {e}")
+            return
+        self.ecritures += 1
+        self.derniere_ecriture = datetime.now().isoformat(timespec="seconds")
+
+    def stats(self):
+        return {
+            "chemin": self.chemin,
+            "actif": self.actif,
+            "lectures": self.lectures,
+            "ecritures": self.ecritures,
+            "erreurs": self.erreurs,
+            "derniere_ecriture": self.derniere_ecriture,
+        }
 
-    # Modules par type
-    MODULES_PAR_TYPE = {
-        "CQH": {66, 64, 63, 62, 61, 60},
-        "CQM": {97, 98, 92, 90, 105, 104, 103},
-        "CQS": {96, 95, 94, 93, 91, 106},
-    }
-
-    # 3. Construis les tableaux comme dans /cq_dashboard
-    # Pour CQH
-    real_cqh = []
-    for _, row in rows.iterrows():
-        module_id = row["Id_UserModule"]
-        id_obj = row["Id_Object"]
-        name = row["Name"]
-        study_date = row["StudyDate"]
-
-        # --- Correction: logique TOMO 1 et 2 comme dans dashboard car tout nos protocoles TOMO partagent le meme module sinon pas besoin de regex---
-        if id_obj in [99, 121]:  # TOMO1 ou TOMO2
-            if not CQH_REGEX.search(str(name)):
-                continue
-        else:
-            if module_id not in MODULES_PAR_TYPE["CQH"]:
-                continue
 
-        if id_obj not in MACHINES:
-            continue
-        if pd.isna(study_date):
-            continue
-        study_date = pd.to_datetime(study_date).date()
-        real_cqh.append({"Id_Object": id_obj, "Date": study_date})
-
-    df_cqh = pd.DataFrame(real_cqh)
-    machines_cqh = sorted(df_cqh['Id_Object'].unique())
-    cqh_data = []
-    for _, sem in df_semaines.iterrows():
-        row = {"Semaine": sem["Semaine"], "Year": sem["DateDebut"].year}
-        for id_obj in machines_cqh:
-            machine_name = MACHINES.get(id_obj, ("❓",))[0]
-            done = df_cqh[
-                (df_cqh["Id_Object"] == id_obj) &
-                (df_cqh["Date"] >= sem["DateDebut"]) &
-                (df_cqh["Date"] <= sem["DateFin"])
-            ]
-            if not done.empty:
-                row[machine_name] = "✅"
-            elif sem["DateFin"] < today:
-                row[machine_name] = "❌"
-            else:
-                row[machine_name] = "⏳"
-        cqh_data.append(row)
-    df_cqh_final = pd.DataFrame(cqh_data)
-
-    # Pour CQM
-    real_cqm = []
-    for _, row in rows.iterrows():
-        if is_valid_cq_name(row["Name"], "CQM", module_id=row["Id_UserModule"]):
-            result_date = pd.to_datetime(row["StudyDate"]).date()
-            id_obj = row["Id_Object"]
-            machine = MACHINES.get(id_obj, (None,))[0]
-            if not machine: continue
-            match = df_mois[
-                (df_mois["DateDebut"] <= result_date) &
-                (df_mois["DateFin"] >= result_date)
-            ]
-            if match.empty: continue
-            real_cqm.append({
-                "Machine": machine,
-                "Date": result_date
-            })
-    df_cqm = pd.DataFrame(real_cqm)
-    machines_cqm = sorted(df_cqm['Machine'].unique())
-    cqm_data = []
-    for _, mois in df_mois.iterrows():
-        row = {"Mois": mois["Mois"]}
-        for m in machines_cqm:
-            done = df_cqm[
-                (df_cqm["Machine"] == m) &
-                (df_cqm["Date"] >= mois["DateDebut"]) &
-                (df_cqm["Date"] <= mois["DateFin"])
-            ]
-            if not done.empty:
-                row[m] = "✅"
-            elif mois["DateFin"] < today:
-                row[m] = "❌"
-            else:
-                row[m] = "⏳"
-        cqm_data.append(row)
-    df_cqm_final = pd.DataFrame(cqm_data)
-
-    # Pour CQS
-    real_cqs = []
-    for _, row in rows.iterrows():
-        if is_valid_cq_name(row["Name"], "CQS", module_id=row["Id_UserModule"]):
-            result_date = pd.to_datetime(row["StudyDate"]).date()
-            id_obj = row["Id_Object"]
-            machine = MACHINES.get(id_obj, (None,))[0]
-            if machine:
-                real_cqs.append({
-                    "Machine": machine,
-                    "Date": result_date
-                })
-    df_cqs = pd.DataFrame(real_cqs)
-    machines_cqs = sorted(df_cqs['Machine'].unique())
-    cqs_data = []
-    for _, sem in df_semestres.iterrows():
-        row = {"Semestre": sem["Semestre"], "Year": sem["Year"]}
-        for m in machines_cqs:
-            done = df_cqs[
-                (df_cqs["Machine"] == m) &
-                (df_cqs["Date"] >= sem["DateDebut"]) &
-                (df_cqs["Date"] <= sem["DateFin"])
-            ]
-            if not done.empty:
-                row[m] = "✅"
-            elif sem["DateFin"] < today:
-                row[m] = "❌"
-            else:
-                row[m] = "⏳"
-        cqs_data.append(row)
-
-    df_cqs_final = pd.DataFrame(cqs_data)
-
-    if 'Year' in df_cqh_final:
-        df_cqh_final = df_cqh_final[df_cqh_final['Year'] == annee]
-    if 'Year' in df_cqm_final:
-        df_cqm_final = df_cqm_final[df_cqm_final['Year'] == annee]
-    if 'Year' in df_cqs_final:
-        df_cqs_final = df_cqs_final[df_cqs_final['Year'] == annee] 
-
-    # 4. Calcul des taux de conformité pour chaque machine
-        # Liste brute de toutes les colonnes (hors 1re colonne)
-    cols_cqh = [c for c in df_cqh_final.columns if c not in ("Semaine", "Year")]
-    cols_cqm = [c for c in df_cqm_final.columns if c not in ("Mois", "Year")]
-    cols_cqs = [c for c in df_cqs_final.columns if c not in ("Semestre", "Year")]
-
-    machines = sorted(set(cols_cqh) | set(cols_cqm) | set(cols_cqs))
-
-    taux_cqh, taux_cqm, taux_cqs = {}, {}, {}
-
-    for m in machines:
-        # Trouve la colonne correspondante, insensible à la casse et aux espaces
-        col_cqh = [c for c in df_cqh_final.columns if c.replace(" ", "").upper() == m.replace(" ", "").upper()]
-        if col_cqh:
-            col = col_cqh[0]
-            conforme = (df_cqh_final[col] == "✅").sum()
-            a_juger = (df_cqh_final[col].isin(["✅", "❌"])).sum()
-            taux_cqh[m] = round((conforme / a_juger) * 100, 1) if a_juger > 0 else 100.0
-        else:
-            taux_cqh[m] = 0.0
-
-        col_cqm = [c for c in df_cqm_final.columns if c.replace(" ", "").upper() == m.replace(" ", "").upper()]
-        if col_cqm:
-            col = col_cqm[0]
-            conforme = (df_cqm_final[col] == "✅").sum()
-            a_juger = (df_cqm_final[col].isin(["✅", "❌"])).sum()
-            taux_cqm[m] = round((conforme / a_juger) * 100, 1) if a_juger > 0 else 100.0
-        else:
-            taux_cqm[m] = 0.0
-
-        col_cqs = [c for c in df_cqs_final.columns if c.replace(" ", "").upper() == m.replace(" ", "").upper()]
-        if col_cqs:
-            col = col_cqs[0]
-            conforme = (df_cqs_final[col] == "✅").sum()
-            a_juger = (df_cqs_final[col].isin(["✅", "❌"])).sum()
-            taux_cqs[m] = round((conforme / a_juger) * 100, 1) if a_juger > 0 else 100.0
+class SyncIncrementale:
+    # Chargeur du cache : ne récupère que les études plus récentes que le dernier Id_ControleStudy connu,
+    # avec une relecture complète périodique (modifications, suppressions, RESULT ajoutés après coup)
+    def __init__(self, periode_reconciliation, instantane=None):
+        self.periode_reconciliation = periode_reconciliation
+        self.instantane = instantane
+        self.high_water_mark = None
+        self.derniere_reconciliation = None
+        self.reconcilie_le = None
+        # Données servies depuis l'instantané local, pas encore rattrapées depuis Artiscan
+        self.rattrapage_en_attente = False
+        # Worker sans le scheduler : suit l'instantané local au lieu d'interroger Artiscan (voir demarrer_taches_planifiees)
+        self.suiveur = False
+        # Incrémentée quand l'extraction est remplacée (relecture complète, instantané) ; entre deux générations les
+        # lignes existantes sont inchangées et les nouvelles études ajoutées à la fin (alertes : seul le delta est évalué)
+        self.generation = 0
+        self.syncs_completes = 0
+        self.syncs_delta = 0
+        self.lignes_delta = 0
+
+    def reconciliation_due(self):
+        return (self.derniere_reconciliation is None or
+                time.monotonic() - self.derniere_reconciliation > self.periode_reconciliation)
+
+    def signature(self):
+        # Un instantané extrait avec une autre requête ou un autre filtre (machines, modules, ANNEE_DEBUT) n'est pas réutilisé
+        condition, params = filtre_extraction_cq()
+        return hashlib.sha1(repr((REQUETE_CQ, condition, params)).encode()).hexdigest()
+
+    def _depuis_instantane(self):
+        rows, meta = self.instantane.lire(self.signature())
+        if rows is None:
+            return None
+        self.generation += 1
+        rows.attrs["generation"] = self.generation
+        self.high_water_mark = meta["high_water_mark"]
+        self.reconcilie_le = meta["reconcilie_le"]
+        # La relecture complète reste due à la même échéance qu'avant le redémarrage
+        self.derniere_reconciliation = time.monotonic() - max(0.0, time.time() - self.reconcilie_le)
+        self.rattrapage_en_attente = True
+        print(f"✅ Instantané local chargé : {len(rows)} études (sauvegardé le {meta['sauvegarde_le']})")
+        return rows
+
+    def _suivre(self, precedent):
+        # Recharge l'instantané dès que le processus qui porte le scheduler l'a réécrit
+        modification = self.instantane.modification()
+        if modification is None or modification == self.instantane.lu_modification:
+            return precedent
+        rows = self._depuis_instantane()
+        self.rattrapage_en_attente = False
+        return precedent if rows is None else rows
+
+    def _sauvegarder(self, rows):
+        if self.instantane is None or self.suiveur:
+            return
+        self.instantane.ecrire(rows, {
+            "signature": self.signature(),
+            "high_water_mark": self.high_water_mark,
+            "reconcilie_le": self.reconcilie_le,
+            "sauvegarde_le": datetime.now().isoformat(timespec="seconds"),
+        })
+
+    def __call__(self, precedent=None):
+        import pandas as pd
+        if self.suiveur and self.instantane is not None and self.instantane.actif:
+            rows = self._suivre(precedent)
+            if rows is not None:
+                return rows
+
+        if precedent is None and self.instantane is not None:
+            rows = self._depuis_instantane()
+            if rows is not None:
+                return rows
+
+        if precedent is None or self.high_water_mark is None or self.reconciliation_due():
+            rows = charger_extraction_cq()
+            self.generation += 1
+            self.derniere_reconciliation = time.monotonic()
+            self.reconcilie_le = time.time()
+            self.syncs_completes += 1
         else:
-            taux_cqs[m] = 0.0
+            delta = charger_extraction_cq(" AND cs.Id_ControleStudy > ?", params=[self.high_water_mark])
+            self.syncs_delta += 1
+            self.lignes_delta += len(delta)
+            if delta.empty:
+                self.rattrapage_en_attente = False
+                return precedent
+            rows = pd.concat([precedent, delta], ignore_index=True)
+        rows.attrs["generation"] = self.generation
+
+        if not rows.empty:
+            self.high_water_mark = int(rows["Id_ControleStudy"].max())
+        self.rattrapage_en_attente = False
+        self._sauvegarder(rows)
+        return rows
+
+    def stats(self):
+        return {
+            "high_water_mark": self.high_water_mark,
+            "generation": self.generation,
+            "syncs_completes": self.syncs_completes,
+            "syncs_delta": self.syncs_delta,
+            "lignes_delta": self.lignes_delta,
+            "rattrapage_en_attente": self.rattrapage_en_attente,
+            "suiveur": self.suiveur,
+            "instantane": self.instantane.stats() if self.instantane is not None else None,
+        }
 
-    
 
+class CacheExtraction:
+    # Instantané partagé (thread-safe) de l'extraction SQL : servi tel quel (même périmé)
+    # pendant qu'un rafraichissement tourne en arrière-plan, une seule requête SQL à la fois
+    def __init__(self, chargeur, ttl):
+        self.chargeur = chargeur
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._data = None
+        self._charge_le = None
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.erreurs = 0
+        self.derniere_erreur = None
+
+    def age(self):
+        if self._charge_le is None:
+            return None
+        return time.monotonic() - self._charge_le
+
+    def duree_restante(self):
+        # Secondes avant que l'instantané ne soit considéré périmé (durée de cache HTTP des pages)
+        age = self.age()
+        return 0 if age is None else max(0, int(self.ttl - age))
+
+    def get(self):
+        return self.get_snapshot()[0]
+
+    def get_snapshot(self):
+        # (données, version) lus ensemble : la version identifie l'instantané pour les calculs mémoïsés
+        with self._lock:
+            data, version = self._data, self.version
+            if data is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if data is not None:
+            if self.age() > self.ttl:
+                self.rafraichir_en_arriere_plan()
+            return data, version
+
+        # Premier chargement : synchrone, les autres threads attendent le même chargement
+        with self._refresh_lock:
+            if self._data is None:
+                self._charger()
+            with self._lock:
+                data, version = self._data, self.version
+        self._rattraper_si_besoin()
+        return data, version
+
+    def _charger(self):
+        try:
+            data = self.chargeur(self._data)
+        except Exception as e:
+            with self._lock:
+                self.erreurs += 1
+                self.derniere_erreur = str(e)
+            raise
+        with self._lock:
+            # La version ne change que si les données ont changé (delta vide => même instantané)
+            if data is not self._data:
+                self.version += 1
+            self._data = data
+            self._charge_le = time.monotonic()
+            self.refreshes += 1
+
+    def rafraichir(self):
+        # Utilisé par le scheduler : ne relance pas une extraction si une autre est déjà en cours
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._charger()
+        except Exception as e:
+            print(f"❌ Erreur rafraichissement cache CQ : {e}")
+            return
+        finally:
+            self._refresh_lock.release()
+        self._rattraper_si_besoin()
+
+    def _rattraper_si_besoin(self):
+        # Après un démarrage depuis l'instantané local : rattrapage (delta) immédiat, sans faire attendre la page
+        if getattr(self.chargeur, "rattrapage_en_attente", False):
+            self.rafraichir_en_arriere_plan()
+
+    def rafraichir_en_arriere_plan(self):
+        if self._refresh_lock.locked():
+            return
+        threading.Thread(target=self.rafraichir, daemon=True).start()
+
+    def stats(self):
+        age = self.age()
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "age_secondes": round(age, 1) if age is not None else None,
+                "ttl_secondes": self.ttl,
+                "version": self.version,
+                "refreshes": self.refreshes,
+                "erreurs": self.erreurs,
+                "derniere_erreur": self.derniere_erreur,
+                "rafraichissement_en_cours": self._refresh_lock.locked(),
+                "lignes": len(self._data) if self._data is not None else 0,
+            }
 
-    return machines, taux_cqh, taux_cqm, taux_cqs
 
+sync_cq = SyncIncrementale(RECONCILIATION_COMPLETE_SECONDES, InstantaneLocal(INSTANTANE_LOCAL))
+cache_cq = CacheExtraction(sync_cq, CACHE_TTL_SECONDES)
 
 
 
-def is_valid_cq_name(name, typ, module_id=None):
-    name_clean = name.lower().replace(" ", "").replace("_", "")
+def conformite_courante(today=None):
+    # Tableaux CQH/CQM/CQS + taux, calculés une seule fois par instantané du cache et par jour
+    from cq_conformite import conformite_memo
+    rows, version = cache_cq.get_snapshot()
+    return conformite_memo(rows, version, today)
 
-    # 🔴 Exclusion forte (à conserver)
-    EXCLUSION_REGEX = re.compile(r"(?i)(test|à ?supp|a ?supp|à ?supprimer|a ?supprimer|essai|asupprimer|àsupprimer)")
-    if EXCLUSION_REGEX.search(name):
-        return False
 
-    # ✅ CQH : seulement exclusion, plus de test sur le nom
-    if typ == "CQH":
-        return module_id in MODULES_PAR_TYPE["CQH"]
+# Base de données commentaires légère sous forme de fichier pour justifier si il y a un non-conformité de périodicité sur un contrôle
+stock_commentaires = StockCommentaires(COMMENT_DB)
+notifications = DispatcheurTeams()
+alertes = MoteurAlertes(notifications)
+# États (machine, type, période) persistés, mis à jour par le scheduler : taux de la page d'accueil par agrégation
+etats_cq = EtatsConformite()
 
-    # ✅ CQM : on garde regex + fallback sur module
-    if typ == "CQM":
-        CQM_REGEX = re.compile(r"(?i)(cqm|controlequalitemensuel(le)?|contrôlequalitémensuel(le)?)")
-        return bool(CQM_REGEX.search(name)) or (module_id in MODULES_PAR_TYPE["CQM"])
 
-    # ✅ CQS (même logique que CQM)
-    if typ == "CQS":
-        CQS_REGEX = re.compile(r"(?i)(cqs|controlequalitesemestriel(le)?|contrôlequalitésemestriel(le)?)")
-        return bool(CQS_REGEX.search(name)) or (module_id in MODULES_PAR_TYPE["CQS"])
+def get_taux_conformite(annee=None):
+    if annee is None:
+        annee = date.today().year
+    try:
+        taux = etats_cq.taux(annee)
+    except sqlite3.Error as e:
+        print(f"❌ Erreur lecture des états de conformité : {e}")
+        taux = None
+    if taux is not None:
+        return taux
+    # Table des états pas encore construite (premier démarrage) ou année hors suivi : calcul depuis l'instantané
+    try:
+        conformite = conformite_courante()
+    except Exception as e:
+        print(f"Erreur SQL : {e}")
+        return [], {}, {}, {}
+    return conformite.taux(annee)
 
-    return False
 
+def moyenne_taux(taux):
+    vals = [v for v in taux.values() if isinstance(v, (int, float)) and v is not None]
+    return round(sum(vals) / len(vals), 1) if vals else 0
 
 
-@app.route("/")
-def index():
-    annee = int(request.args.get("annee", 2025))
-    machines, taux_cqh, taux_cqm, taux_cqs = get_taux_conformite(annee)
-    today = date.today()
-    week_number = today.isocalendar()[1]
-    total_weeks = date(today.year, 12, 28).isocalendar()[1]  # 28 déc = dernière semaine ISO
-    progress_percent = round((week_number / total_weeks) * 100, 1)
 
-    def moyenne(taux):
-        vals = [v for v in taux.values() if isinstance(v, (int, float)) and v is not None]
-        return round(sum(vals) / len(vals), 1) if vals else 0
-
-    moyenne_cqh = moyenne(taux_cqh)
-    moyenne_cqm = moyenne(taux_cqm)
-    moyenne_cqs = moyenne(taux_cqs)
-    return render_template_string("""
-<!DOCTYPE html>
-<html lang="fr">
-<head>
-  <meta charset="UTF-8">
-  <title>📅 Planning CQ - Artiscan</title>
-  <link href="https://cdn.jsdelivr.net/npm/fullcalendar@6.1.8/main.min.css" rel="stylesheet">
-  <script src="https://cdn.jsdelivr.net/npm/fullcalendar@6.1.8/index.global.min.js"></script>
-  <style>
-    body {
-      font-family: 'Segoe UI', Arial, sans-serif;
-      background: #f6f8fb;
-      margin: 0;
-      padding: 0;
-    }
-    header {
-      background: #fff;
-      box-shadow: 0 2px 14px rgba(32,40,64,0.07);
-      padding: 25px 0 14px 0;
-      border-bottom: 1px solid #eee;
-      margin-bottom: 0;
-    }
-    .header-bar {
-      max-width: 1400px;
-      margin: auto;
-      display: flex;
-      align-items: center;
-      justify-content: space-between;
-    }
-    .header-title {
-      font-size: 2rem;
-      font-weight: 600;
-      color: #253858;
-      letter-spacing: -1px;
-      display: flex;
-      align-items: center;
-      gap: 16px;
-    }
-    .header-logo {
-      height: 120px;
-    }
-    #filterBar {
-      max-width: 1400px;
-      margin: 38px auto 0 auto;
-      text-align: center;
-      background: #fff;
-      border-radius: 16px;
-      padding: 18px 0 6px 0;
-      box-shadow: 0 2px 14px #0001;
-    }
-    #searchInput {
-      padding: 12px 18px;
-      border-radius: 22px;
-      border: 1px solid #d3d3e0;
-      width: 320px;
-      box-shadow: 0 2px 8px #0001;
-      font-size: 1.1rem;
-      margin-bottom: 10px;
-    }
-    label {
-      margin: 0 8px;
-      font-weight: 500;
-    }
-    #calendar {
-      max-width: 1600px;
-      margin: 35px auto 0 auto;
-      background: #fff;
-      border-radius: 26px;
-      padding: 36px 24px;
-      box-shadow: 0 8px 40px rgba(32,40,64,0.12);
-    }
-    #stats {
-      max-width: 1000px;
-      margin: 40px auto;
-      background: #fff;
-      padding: 28px;
-      border-radius: 16px;
-      box-shadow: 0 0 10px rgba(0,0,0,0.09);
-    }
-    table {
-      width: 100%;
-      border-collapse: collapse;
-      margin-top: 10px;
-      font-size: 1rem;
-    }
-    th, td {
-      padding: 9px;
-      text-align: center;
-      border: 1px solid #ececec;
-    }
-    th {
-      background-color: #f0f0f0;
-    }
-    .btn-primary {
-      background: #0051ba;
-      border: none;
-      border-radius: 18px;
-      font-weight: 600;
-      font-size: 1.1rem;
-      padding: 10px 32px;
-      color: #fff;
-      transition: background .2s;
-      box-shadow: 0 2px 8px #0051ba20;
-      margin-top: 14px;
-    }
-    .btn-primary:hover {
-      background: #0063cc;
-      color: #fff;
-    }
-  </style>
-</head>
-<body>
-  <!-- Barre d'en-tête moderne -->
-  <header>
-    <div class="header-bar">
-      <div class="header-title">
-        📊 Suivi de la réalisation périodique des Contrôles Qualité à l'Institut Gustave Roussy
-      </div>
-      <img src="/static/logo_gustave_roussy_rvb.jpg" alt="Gustave Roussy" class="header-logo">
-    </div>
-  </header>
-
-  <div id="filterBar">
-    <input type="text" id="searchInput" placeholder="🔍 Rechercher un mot-clé...">
-    <br><br>
-    <label><input type="checkbox" class="type-filter" value="CQH" checked> CQH</label>
-    <label><input type="checkbox" class="type-filter" value="CQM" checked> CQM</label>
-    <label><input type="checkbox" class="type-filter" value="CQS" checked> CQS</label>
-    <label><input type="checkbox" class="type-filter" value="CQQ"> CQQ</label>
-    <label><input type="checkbox" class="type-filter" value="TOMO" checked> TOMO</label>
-  </div>
-  <div style="text-align:center; margin: 30px;">
-    <a href="/cq_dashboard" class="btn btn-primary">📊 Suivi Global CQ</a>
-  </div>
-  <div id="calendar"></div>
-
-
-
-  <div id="stats">
-    <h2 style="margin-bottom:22px;">📈 Taux de conformité par machine</h2>
-    <div style="margin-bottom:15px;">
-    <form method="get" style="display:inline;">
-        <label>Sélectionner l'année :
-        <select name="annee" onchange="this.form.submit()">
-            <option value="2024" {% if annee == 2024 %}selected{% endif %}>2024</option>
-            <option value="2025" {% if annee == 2025 %}selected{% endif %}>2025</option>
-        </select>
-        </label>
-    </form>
-    </div>
-    <table>
-      <thead>
-        <tr>
-          <th>Machine</th>
-          <th>CQH (%)</th>
-          <th>CQM (%)</th>
-          <th>CQS (%)</th>
-        </tr>
-      </thead>
-      <tbody>
-        {% for m in machines %}
-        <tr>
-          <td>{{ m }}</td>
-          <td>{{ taux_cqh[m] }}</td>
-          <td>{{ taux_cqm[m] }}</td>
-          <td>{{ taux_cqs[m] }}</td>
-        </tr>
-        {% endfor %}
-      </tbody>
-        <tfoot>
-            <tr style="background:#f3f3f3; font-weight:600;">
-             <td>Moyenne conformité</td>
-             <td>{{ moyenne_cqh }}</td>
-             <td>{{ moyenne_cqm }}</td>
-             <td>{{ moyenne_cqs }}</td>
-             </tr>
-        </tfoot>                            
-    </table>
-    <div style="max-width: 600px; margin: 30px auto 0;">
-      <div style="display:flex; justify-content:space-between; margin-bottom: 6px;">
-        <span>Progression annuelle :</span>
-        <span>{{ week_number }}/{{ total_weeks }} semaines ({{ progress_percent }}%)</span>
-      </div>
-      <div style="background: #eee; border-radius: 6px; overflow: hidden;">
-        <div style="height: 22px; background: linear-gradient(90deg, #73d13d, #4096ff); width: {{ progress_percent }}%; transition: width 0.8s;"></div>
-      </div>
-    </div>
-  </div>
-                                  
-  <script>
-    let allEvents = [];
-    let calendar;
-
-    async function loadCalendar() {
-      const res = await fetch("/cq");
-      allEvents = await res.json();
-
-      calendar = new FullCalendar.Calendar(document.getElementById("calendar"), {
-        initialView: 'dayGridMonth',
-        locale: 'fr',
-        firstDay: 1,
-        hiddenDays: [0, 6],
-        headerToolbar: {
-          left: 'prev,next today',
-          center: 'title',
-          right: 'dayGridMonth,workWeek,listWeek'
-        },
-        views: {
-          workWeek: {
-            type: 'timeGridWeek',
-            buttonText: 'Semaine (L-V)'
-          }
-        },
-        events: allEvents,
-        eventClick: function(info) {
-          const e = info.event;
-          alert(`🗂 ${e.title}\n📆 ${e.start.toLocaleString()}\n🖥️ Machine : ${e.extendedProps.machine}`);
-        }
-      });
+# Page calculée depuis l'instantané seul : gardée par le navigateur jusqu'au prochain rafraichissement prévu
+# (pas /cq_dashboard, dont les badges de commentaires changent à tout moment, ni /cq, interrogé en direct)
+ROUTES_CACHEES = {"index"}
+# Réponses de repli après une erreur : jamais gardées
+SANS_CACHE = {"Cache-Control": "no-store"}
+# Réponses compressées (gzip, ou brotli si disponible) : Wi-Fi lent des tablettes aux postes de traitement
+TYPES_COMPRESSES = {"text/html", "application/json", "text/csv"}
+TAILLE_MIN_COMPRESSION = 1024
 
-      calendar.render();
-    }
 
-    function applyFilters() {
-      const search = document.getElementById("searchInput").value.toLowerCase();
-      const activeTypes = Array.from(document.querySelectorAll(".type-filter:checked")).map(cb => cb.value);
+def gzip_flux(morceaux):
+    # Compression au fil de l'eau d'une réponse en flux (exports) : wbits=31 -> en-tête et CRC gzip
+    compresseur = zlib.compressobj(6, zlib.DEFLATED, 31)
+    try:
+        for morceau in morceaux:
+            data = compresseur.compress(morceau)
+            if data:
+                yield data
+        yield compresseur.flush()
+    finally:
+        if hasattr(morceaux, "close"):
+            morceaux.close()
+
+
+def compresser(response):
+    if (response.mimetype not in TYPES_COMPRESSES or response.status_code != 200 or
+            response.direct_passthrough or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    encodages = request.accept_encodings
+    if response.is_streamed:
+        # Exports CSV en flux : taille inconnue d'avance, gzip morceau par morceau
+        if encodages["gzip"]:
+            response.response = gzip_flux(response.response)
+            response.headers["Content-Encoding"] = "gzip"
+        return response
+    if brotli is not None and encodages["br"]:
+        encodage = "br"
+    elif encodages["gzip"]:
+        encodage = "gzip"
+    else:
+        return response
+    data = response.get_data()
+    if len(data) < TAILLE_MIN_COMPRESSION:
+        return response
+    response.set_data(brotli.compress(data, quality=5) if encodage == "br" else gzip.compress(data, compresslevel=6))
+    response.headers["Content-Encoding"] = encodage
+    # Le corps envoyé n'est plus celui de l'ETag : ETag faible (les 304 restent valables, comparaison faible)
+    etag, faible = response.get_etag()
+    if etag and not faible:
+        response.set_etag(etag, weak=True)
+    return response
 
-      const filtered = allEvents.filter(ev => {
-        const matchesType = activeTypes.some(type => ev.title.startsWith(type));
-        const matchesSearch = ev.title.toLowerCase().includes(search);
-        return matchesType && matchesSearch;
-      });
 
-      calendar.removeAllEvents();
-      calendar.addEventSource(filtered);
-    }
+@app.after_request
+def en_tetes_reponse(response):
+    if (request.endpoint in ROUTES_CACHEES and response.status_code == 200 and
+            "Cache-Control" not in response.headers):
+        response.headers["Cache-Control"] = f"private, max-age={cache_cq.duree_restante()}"
+    return compresser(response)
 
-    document.addEventListener("DOMContentLoaded", async function () {
-      await loadCalendar();
-      applyFilters();
 
-      document.getElementById("searchInput").addEventListener("input", applyFilters);
-      document.querySelectorAll(".type-filter").forEach(cb => cb.addEventListener("change", applyFilters));
-    });
-  </script>
-</body>
-</html>
-""", taux_cqh=taux_cqh, taux_cqm=taux_cqm, taux_cqs=taux_cqs, machines=machines, progress_percent=progress_percent, week_number=week_number, total_weeks=total_weeks, moyenne_cqh=moyenne_cqh, moyenne_cqm=moyenne_cqm, moyenne_cqs=moyenne_cqs, annee=annee)
+@app.route("/")
+def index():
+    today = date.today()
+    annees = calendrier.annees(today)
+    annee = request.args.get("annee", type=int)
+    if annee not in annees:
+        annee = annees[-1]
+    machines, taux_cqh, taux_cqm, taux_cqs = get_taux_conformite(annee)
+    week_number = today.isocalendar()[1]
+    total_weeks = date(today.year, 12, 28).isocalendar()[1]  # 28 déc = dernière semaine ISO
+    progress_percent = round((week_number / total_weeks) * 100, 1)
 
+    moyenne_cqh = moyenne_taux(taux_cqh)
+    moyenne_cqm = moyenne_taux(taux_cqm)
+    moyenne_cqs = moyenne_taux(taux_cqs)
+    html = render_template("index.html", taux_cqh=taux_cqh, taux_cqm=taux_cqm, taux_cqs=taux_cqs, machines=machines, progress_percent=progress_percent, week_number=week_number, total_weeks=total_weeks, moyenne_cqh=moyenne_cqh, moyenne_cqm=moyenne_cqm, moyenne_cqs=moyenne_cqs, annee=annee, annees=annees)
+    if not machines:
+        # Taux indisponibles (erreur SQL) : page de repli
+        return html, 200, SANS_CACHE
+    return html
+
+
+
+# Types de CQ affichés dans le calendrier (filtres de la page d'accueil) : CQH / CQM / CQS selon les règles de
+# classification du dashboard (cq_regles), les autres par module Artiscan
+CQ_TYPE_MODULES = {
+    'CQQ': {25, 27, 28, 29, 30, 32, 36, 37, 38},
+    'TOMO': {24, 26}
+}
+CQ_TYPES_CALENDRIER = (*TYPES_CQ, *CQ_TYPE_MODULES)
+
+
+def type_calendrier(id_obj, id_user_module, name):
+    bits = regles.classer(id_obj, id_user_module, str(name))
+    for typ in TYPES_CQ:
+        if est_du_type(bits, typ):
+            return typ
+    for label, ids in CQ_TYPE_MODULES.items():
+        if id_user_module in ids:
+            return label
+    return ""
+
+
+def filtre_types_calendrier(types, machines):
+    # Filtre SQL large (modules des types demandés, machines classées par nom) : le type exact est vérifié ensuite
+    modules = set()
+    for typ in types:
+        if typ in CQ_TYPE_MODULES:
+            modules |= CQ_TYPE_MODULES[typ]
+        else:
+            modules.update(*(regles.modules(typ, id_obj) for id_obj in machines))
+    modules = sorted(modules)
+    par_nom = sorted(regles.machines_par_nom & set(machines))
+    conditions, params = [], []
+    if modules:
+        conditions.append(f"cs.Id_UserModule IN ({marqueurs(modules)})")
+        params += modules
+    if par_nom:
+        conditions.append(f"cs.Id_Object IN ({marqueurs(par_nom)})")
+        params += par_nom
+    return "(" + " OR ".join(conditions or ["1 = 0"]) + ")", params
+
+
+def parse_date_calendrier(valeur):
+    # FullCalendar envoie start/end en ISO 8601, éventuellement avec fuseau : on garde l'heure locale
+    if not valeur:
+        return None
+    import pandas as pd
+    ts = pd.Timestamp(valeur)
+    if ts.tzinfo is not None:
+        ts = ts.tz_localize(None)
+    return ts.to_pydatetime()
+
+
+def liste_ids(valeur, autorises):
+    # "145,182" -> [145, 182] en ne gardant que les valeurs connues
+    if not valeur:
+        return None
+    ids = [int(v) for v in valeur.split(",") if v.strip().isdigit()]
+    return [i for i in ids if i in autorises]
 
 
 @app.route('/cq')
 def get_cq():
+    # Flux JSON FullCalendar : la fenêtre affichée (start/end) et les filtres machine / type sont passés à la requête SQL
     try:
-        conn = pyodbc.connect(conn_str, timeout=5)
-        cursor = conn.cursor()
-
-        query = """
+        start = parse_date_calendrier(request.args.get("start"))
+        end = parse_date_calendrier(request.args.get("end"))
+        machines = liste_ids(request.args.get("machine"), MACHINES)
+        if machines is None:
+            machines = list(MACHINES)
+        types = [t for t in request.args.get("types", "").split(",") if t in CQ_TYPES_CALENDRIER]
+
+        if not machines or (types == [] and request.args.get("types")):
+            return jsonify([])
+
+        conditions = ["cs.StudyDate IS NOT NULL", EXISTE_RESULTAT]
+        params = []
+        if start:
+            conditions.append("cs.StudyDate >= ?")
+            params.append(start)
+        if end:
+            conditions.append("cs.StudyDate < ?")
+            params.append(end)
+        conditions.append(f"cs.Id_Object IN ({marqueurs(machines)})")
+        params += machines
+        if types:
+            condition, params_types = filtre_types_calendrier(types, machines)
+            conditions.append(condition)
+            params += params_types
+
+        query = f"""
         SELECT cs.Id_ControleStudy, cs.Id_Object, cs.Name, cs.Id_UserModule, cs.StudyDate
         FROM CONTROLE_STUDY cs
-        JOIN RESULT r ON cs.Id_ControleStudy = r.Id_ControleStudy
+        WHERE {' AND '.join(conditions)}
         ORDER BY cs.Id_ControleStudy DESC
         """
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        #rows = pd.DataFrame(rows, columns=["Id_ControleStudy", "Id_Object", "Name", "Id_UserModule", "ResultDate"])
-
-        conn.close()
-
-        CQ_TYPE = {
-            'CQH': {66, 64, 63, 62, 61, 60},
-            'CQM': {97, 98, 92, 90, 105, 104, 103},
-            'CQS': {96, 95, 94, 93, 91, 106},
-            'CQQ': {25, 27, 28, 29, 30, 32, 36, 37, 38},
-            'TOMO': {24, 26}
-        }
+        with pool_sql.connexion() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            cursor.close()
 
         events = []
         for row in rows:
             id_control, id_object, name, id_user_module, study_date = row
 
             if not study_date:
-                continue  
+                continue
             if isinstance(study_date, str):
-                study_date = pd.to_datetime(study_date)
-            if hasattr(study_date, "date"):
-                study_date = study_date
-
-            cq_prefix = ""
-            for label, ids in CQ_TYPE.items():
-                if id_user_module in ids:
-                    cq_prefix = f"{label} - "
-                    break
-
-            if id_object in MACHINES:
-                machine_name, color = MACHINES[id_object]
-                events.append({
-                    'id': id_control,
-                    'title': f"{name} ({machine_name})",
-                    'start': study_date.strftime('%Y-%m-%dT%H:%M:%S'),
-                    'color': color,
-                    'machine': machine_name
-                })
+                study_date = datetime.fromisoformat(study_date)
 
+            cq_type = type_calendrier(id_object, id_user_module, name)
+            if types and cq_type not in types:
+                continue
+
+            machine_name, color = MACHINES[id_object]
+            events.append({
+                'id': int(id_control),
+                'title': f"{name} ({machine_name})",
+                'start': study_date.strftime('%Y-%m-%dT%H:%M:%S'),
+                'color': color,
+                'machine': machine_name,
+                'type': cq_type
+            })
 
         return jsonify(events)
 
     except Exception as e:
         print(f"❌ Erreur dans /cq : {e}")
-        return jsonify([])
+        return jsonify([]), 200, SANS_CACHE
+
+# Formats d'export : (générateur du fichier, type MIME)
+FORMATS_EXPORT = {
+    "csv": (flux_csv, "text/csv; charset=utf-8"),
+    "xlsx": (flux_xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+
+@app.route("/export")
+def export():
+    # Export en flux d'un tableau de conformité (cqh, cqm, cqs) ou des études de l'extraction (raw) entre from et to :
+    # lignes produites depuis le calcul partagé et envoyées au fil de l'eau, sans construire le fichier en mémoire
+    typ = request.args.get("type", "cqh").lower()
+    fmt = request.args.get("format", "csv").lower()
+    if typ not in ("cqh", "cqm", "cqs", "raw"):
+        return f"Type d'export inconnu : {typ} (cqh, cqm, cqs ou raw)", 400
+    if fmt not in FORMATS_EXPORT:
+        return f"Format d'export inconnu : {fmt} (csv ou xlsx)", 400
+    try:
+        debut = date.fromisoformat(request.args["from"]) if request.args.get("from") else None
+        fin = date.fromisoformat(request.args["to"]) if request.args.get("to") else None
+    except ValueError:
+        return "Dates attendues au format AAAA-MM-JJ (from, to)", 400
+
+    try:
+        if typ == "raw":
+            entetes, lignes = lignes_etudes(cache_cq.get(), debut, fin)
+        else:
+            entetes, lignes = lignes_tableau(conformite_courante(), typ.upper(), debut, fin)
+    except Exception as e:
+        return f"Erreur export : {e}", 500
+
+    generateur, mimetype = FORMATS_EXPORT[fmt]
+    nom = "_".join(["cq", typ, *(d.isoformat() for d in (debut, fin) if d)]) + "." + fmt
+    response = app.response_class(generateur(entetes, lignes), content_type=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename={nom}"
+    return response
 
-import io
-from flask import make_response
 
 @app.route('/export_cqh_csv')
 def export_cqh_csv():
+    # Ancienne adresse (favoris, scripts) : tableau CQH complet, colonnes et nom de fichier d'origine
     try:
-        # --- Génère ou récupère df_cqh_final comme dans ton dashboard ---
-        today = date.today()
-        semaines = []
-        # Générer les semaines complètes pour 2024 et 2025 (lundi-vendredi)
-        semaines = []
-        current = date(2023, 12, 25)  # pour être sûr d'inclure S1 de 2024
-        current -= timedelta(days=current.weekday())
-        while current.year < 2026:
-            y, w, _ = current.isocalendar()
-            if y >= 2024:
-                semaines.append({
-                    "Semaine": f"S{w}",
-                    "DateDebut": current,
-                    "DateFin": current + timedelta(days=4)
-                })
-            current += timedelta(weeks=1)
-        df_semaines = pd.DataFrame(semaines)
-
-
-        conn = pyodbc.connect(conn_str, timeout=5)
-        rows = pd.read_sql("""
-            SELECT cs.Id_Object, cs.Id_UserModule, cs.Name, cs.StudyDate
-            FROM CONTROLE_STUDY cs
-            JOIN RESULT r ON cs.Id_ControleStudy = r.Id_ControleStudy
-            WHERE cs.StudyDate IS NOT NULL
-        """, conn)
-        conn.close()
-        rows['StudyDate'] = pd.to_datetime(rows['StudyDate'])
-
-        MODULES_PAR_TYPE = {
-            "CQH": {66, 64, 63, 62, 61, 60},
-        }
-
-        real_cqh = []
-        for _, row in rows.iterrows():
-            module_id = row["Id_UserModule"]
-            id_obj = row["Id_Object"]
-            study_date = row["StudyDate"]
-            if module_id not in MODULES_PAR_TYPE["CQH"]:
-                continue
-            if id_obj not in MACHINES:
-                continue
-            if pd.isna(study_date):
-                continue
-            study_date = pd.to_datetime(study_date).date()
-            real_cqh.append({"Id_Object": id_obj, "Date": study_date})
-        df_cqh = pd.DataFrame(real_cqh)
-
-        cqh_data = []
-        for _, sem in df_semaines.iterrows():
-            row = {"Semaine": sem["Semaine"], "Year": sem["DateDebut"].year}
-            for id_obj in MACHINES.keys():
-                machine_name = MACHINES.get(id_obj, ("❓",))[0]
-                done = df_cqh[
-                    (df_cqh["Id_Object"] == id_obj) &
-                    (df_cqh["Date"] >= sem["DateDebut"]) &
-                    (df_cqh["Date"] <= sem["DateFin"])
-                ]
-                if not done.empty:
-                    row[machine_name] = "✅"
-                elif sem["DateFin"] < today:
-                    row[machine_name] = "❌"
-                else:
-                    row[machine_name] = "⏳"
-            cqh_data.append(row)
-        df_cqh_final = pd.DataFrame(cqh_data)
-
-        # -------- Export UTF-8 avec BOM pour Excel --------
-        output = io.StringIO()
-        df_cqh_final.to_csv(output, index=False, sep=';')
-        csv_content = output.getvalue()
-        output.close()
-        csv_content = '\ufeff' + csv_content  # Ajoute BOM UTF-8
-
-        response = make_response(csv_content)
-        response.headers["Content-Disposition"] = "attachment; filename=cqh_dashboard.csv"
-        response.headers["Content-Type"] = "text/csv; charset=utf-8"
-        return response
-
+        entetes, lignes = lignes_tableau(conformite_courante(), "CQH", avec_dates=False)
     except Exception as e:
         return f"Erreur export : {e}", 500
+    response = app.response_class(flux_csv(entetes, lignes), content_type="text/csv; charset=utf-8")
+    response.headers["Content-Disposition"] = "attachment; filename=cqh_dashboard.csv"
+    return response
 
 
 
 
 @app.route("/cq_dashboard")
 def cq_dashboard():
-    # Récupération des deux DataFrames (réutilisation des deux logiques précédentes)
-    # --- Semaines pour CQH ---
-    # Générer les semaines complètes pour 2024 et 2025 (lundi-vendredi)
-    semaines = []
-    current = date(2023, 12, 25)  # pour être sûr d'inclure S1 de 2024
-    current -= timedelta(days=current.weekday())
-    while current.year < 2026:
-        y, w, _ = current.isocalendar()
-        if y >= 2024:
-            semaines.append({
-                "Semaine": f"S{w}",
-                "DateDebut": current,
-                "DateFin": current + timedelta(days=4)
-            })
-        current += timedelta(weeks=1)
-    df_semaines = pd.DataFrame(semaines)
-
-
-    # --- Mois pour CQM ---
-    mois = []
-    for y in (2024, 2025):
-        for m in range(1, 13):
-            mois.append({
-                "Mois": f"{datetime(y, m, 1).strftime('%B').capitalize()} {y}",
-                "Year": y,  # AJOUTE CETTE LIGNE
-                "DateDebut": datetime(y, m, 1).date(),
-                "DateFin": (datetime(y, m + 1, 1) - timedelta(days=1)).date() if m < 12 else date(y, 12, 31)
-            })
-
-    df_mois = pd.DataFrame(mois)
-
-
-
-    # --- Mois pour CQS ---
-    semestres = [
-        {"Semestre": "S1 2024", "DateDebut": date(2024, 1, 1), "DateFin": date(2024, 6, 30), "Year": 2024},
-        {"Semestre": "S2 2024", "DateDebut": date(2024, 7, 1), "DateFin": date(2024, 12, 31), "Year": 2024},
-        {"Semestre": "S1 2025", "DateDebut": date(2025, 1, 1), "DateFin": date(2025, 6, 30), "Year": 2025},
-        {"Semestre": "S2 2025", "DateDebut": date(2025, 7, 1), "DateFin": date(2025, 12, 31), "Year": 2025},
-    ]
-
-    df_semestres = pd.DataFrame(semestres)
-
-
-    # --- Récupération des CQ réalisés ---
+    # Tableaux CQH / CQM / CQS issus du calcul partagé, une seule année calculée et rendue par requête
+    # (?annee=YYYY, année en cours par défaut ; &fragment=1 ne renvoie que les tableaux, pour le changement d'année)
     try:
-        conn = pyodbc.connect(conn_str, timeout=5)
-        rows = pd.read_sql("""
-            SELECT cs.Id_Object, cs.Id_UserModule, cs.Name, cs.StudyDate
-            FROM CONTROLE_STUDY cs
-            JOIN RESULT r ON cs.Id_ControleStudy = r.Id_ControleStudy
-            WHERE cs.StudyDate IS NOT NULL
-        """, conn)
-        conn.close()
+        conformite = conformite_courante()
     except Exception as e:
         return f"Erreur SQL : {e}"
 
-    rows['StudyDate'] = pd.to_datetime(rows['StudyDate'])
-
-
-  
-    # --- CQH ---
-
-
-    MODULES_PAR_TYPE = {
-        "CQH": {66, 64, 63, 62, 61, 60},
-        "CQM": {97, 98, 92, 90, 105, 104, 103},
-        "CQS": {96, 95, 94, 93, 91, 106},
-    }
-
-    global UNKNOWN_MACHINES_CQH
-    UNKNOWN_MACHINES_CQH = []
-
-    real_cqh = []
-    cqh_outside_weeks = []
-
-    for _, row in rows.iterrows():
-        module_id = row["Id_UserModule"]
-        id_obj = row["Id_Object"]
-        name = row["Name"]
-        study_date = row["StudyDate"]
-
-        # 🎯 Ne retenir que les modules CQH sauf pour TOMO 1 et TOMO 2
-        if id_obj in [99, 121]:  # TOMO1 ou TOMO2
-            if not CQH_REGEX.search(str(name)):
-                continue
-        else:
-            # Les autres => classique via module
-            if module_id not in MODULES_PAR_TYPE["CQH"]:
-                continue
-
-        # 🔒 Vérifie que la machine est connue
-        if id_obj not in MACHINES:
-            UNKNOWN_MACHINES_CQH.append(row)
-            continue
-
-        # 🗓 Vérifie que la date est valable
-        if pd.isna(study_date):
-            continue
-
-        study_date = pd.to_datetime(study_date).date()
-
-        # 🧪 Vérifie que la date est dans une semaine déclarée
-        in_range = df_semaines[
-            (df_semaines["DateDebut"] <= study_date) &
-            (df_semaines["DateFin"] >= study_date)
-        ]
-        if in_range.empty:
-            cqh_outside_weeks.append((name, id_obj, study_date))
-
-        real_cqh.append({
-            "Id_Object": id_obj,
-            "Date": study_date
-        })
-
-
-    if module_id in MODULES_PAR_TYPE["CQH"]:
-      if not is_valid_cq_name(name, "CQH", module_id):
-          print(f"❌ Rejeté par nom : {name}")
-      elif id_obj not in MACHINES:
-          print(f"❌ Machine inconnue : {id_obj} pour {name}")
-      elif in_range.empty:
-          print(f"❌ Hors plage semaine : {name} — {study_date}")
-
-    # ✅ Logs de debug
-    #print("🔎 Machines non reconnues :", len(UNKNOWN_MACHINES_CQH))
-    #print("🔎 CQH hors des plages de semaines :", len(cqh_outside_weeks))
-
-    if cqh_outside_weeks:
-        #print("⚠️ CQH hors semaine (à partir de 2025) :")
-        filtered = [item for item in cqh_outside_weeks if item[2] >= datetime(2025, 1, 1).date()]
-        for item in filtered:
-            print(f"❌ {item[0]} — Machine ID {item[1]} — Date {item[2]}")
-        print(f"➡️ Total après 2025 : {len(filtered)} / {len(cqh_outside_weeks)} hors semaine.")
-
-
-    # ✅ Construction du tableau CQH final
-    df_cqh = pd.DataFrame(real_cqh)
-    machines_cqh = sorted(MACHINES.keys())
-
-
-    cqh_data = []
-    today = date.today()
-
-    for _, sem in df_semaines.iterrows():
-        row = {"Semaine": sem["Semaine"], "Year": sem["DateDebut"].year}
-        for id_obj in machines_cqh:
-            machine_name = MACHINES.get(id_obj, ("❓",))[0]
-            done = df_cqh[
-                (df_cqh["Id_Object"] == id_obj) &
-                (df_cqh["Date"] >= sem["DateDebut"]) &
-                (df_cqh["Date"] <= sem["DateFin"])
-            ]
-            if not done.empty:
-                row[machine_name] = "✅"
-            elif sem["DateFin"] < today:
-                row[machine_name] = "❌"
-            else:
-                row[machine_name] = "⏳"
-        cqh_data.append(row)
-
-    df_cqh_final = pd.DataFrame(cqh_data)
-
-    # ✅ Construction du tableau CQM final
-    real_cqm = []
-    cqm_outside_months = []
-    unknown_machine_cqm = []
-
-    for _, row in rows.iterrows():
-        module_id = row["Id_UserModule"]
-        id_obj = row["Id_Object"]
-        name = row["Name"]
-        study_date = row["StudyDate"]
-
-        # 🎯 TOMO1 et TOMO2 => se baser sur le nom
-        if id_obj in [99, 121]:  # TOMO1 ou TOMO2
-            if not CQM_REGEX.search(str(name)):
-                continue
-        else:
-            if module_id not in MODULES_PAR_TYPE["CQM"]:
-                continue
-
-        if pd.isna(study_date):
-            continue
-
-        result_date = pd.to_datetime(study_date).date()
-        machine = MACHINES.get(id_obj, (None,))[0]
-
-        if not machine:
-            unknown_machine_cqm.append((name, id_obj, result_date))
-            continue
-
-        match = df_mois[
-            (df_mois["DateDebut"] <= result_date) & (df_mois["DateFin"] >= result_date)
-        ]
-        if match.empty:
-            cqm_outside_months.append((name, id_obj, result_date))
-            continue
-
-        real_cqm.append({
-            "Machine": machine,
-            "Date": result_date
-        })
-    # Logs utiles
-    #print("🔍 Machines non reconnues (CQM) :", len(unknown_machine_cqm))
-    #print("🔍 CQM hors des plages de mois :", len(cqm_outside_months))
-    if cqm_outside_months:
-        #print("⚠️ CQM hors mois (exemples) :")
-        for item in cqm_outside_months[:10]:
-            print(item)
-
-
-    df_cqm = pd.DataFrame(real_cqm)
-    machines_cqm = sorted(df_cqm['Machine'].unique())
-    cqm_data = []
-
-    for _, mois in df_mois.iterrows():
-        row = {"Mois": mois["Mois"], "Year": mois["Year"]}
-        for m in machines_cqm:
-            done = df_cqm[
-                (df_cqm["Machine"] == m) &
-                (df_cqm["Date"] >= mois["DateDebut"]) &
-                (df_cqm["Date"] <= mois["DateFin"])
-            ]
-            if not done.empty:
-                row[m] = "✅"
-            elif mois["DateFin"] < today:
-                row[m] = "❌"
-            else:
-                row[m] = "⏳"
-        cqm_data.append(row)
-
-    df_cqm_final = pd.DataFrame(cqm_data)
-
-    # ✅ Construction du tableau CQS final
-    real_cqs = []
-    unknown_machine_cqs = []
-
-    for _, row in rows.iterrows():
-        module_id = row["Id_UserModule"]
-        id_obj = row["Id_Object"]
-        name = row["Name"]
-        study_date = row["StudyDate"]
-
-        # 🎯 TOMO1 et TOMO2 => filtrage par nom (CQS)
-        if id_obj in [99, 121]:  # TOMO1 ou TOMO2
-            if not CQS_REGEX.search(str(name)):
-                continue
-        else:
-            if module_id not in MODULES_PAR_TYPE["CQS"]:
-                continue
-
-        if pd.isna(study_date):
-            continue
-
-        result_date = pd.to_datetime(study_date).date()
-        machine = MACHINES.get(id_obj, (None,))[0]
-
-        if not machine:
-            unknown_machine_cqs.append((name, id_obj, result_date))
-            continue
-
-        real_cqs.append({
-            "Machine": machine,
-            "Date": result_date
-        })
-
-    df_cqs = pd.DataFrame(real_cqs)
-    machines_cqs = sorted(df_cqs['Machine'].unique())
-    cqs_data = []
-
-    for _, sem in df_semestres.iterrows():
-        row = {"Semestre": sem["Semestre"], "Year": sem["Year"]}
-        for m in machines_cqs:
-            done = df_cqs[
-                (df_cqs["Machine"] == m) &
-                (df_cqs["Date"] >= sem["DateDebut"]) &
-                (df_cqs["Date"] <= sem["DateFin"])
-            ]
-            if not done.empty:
-                row[m] = "✅"
-            elif sem["DateFin"] < today:
-                row[m] = "❌"
-            else:
-                row[m] = "⏳"
-        cqs_data.append(row)
-
-    df_cqs_final = pd.DataFrame(cqs_data)
-    commentaires = get_commentaires()
-
-
-    years = sorted(df_cqh_final["Year"].unique())
-
-    #a personaliser a souhait avec logo du centre, préférence de police, disposition etc..
-    return render_template_string("""
-    <!DOCTYPE html>
-    <html>
-    <head>
-      <title>Dashboard CQ</title>
-      <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap@4.6.2/dist/css/bootstrap.min.css">
-      <style>
-        td.success { background-color: #d4edda; }
-        td.danger  { background-color: #f8d7da; }
-        td { text-align: center; }
-      </style>
-    </head>
-    <body>
-      <div class="container mt-4">
-        <h2>📋 Dashboard CQ 2025</h2>
-        <ul class="nav nav-tabs" id="cqTab" role="tablist">
-          <li class="nav-item">
-            <a class="nav-link active" id="cqh-tab" data-toggle="tab" href="#cqh" role="tab">CQH Hebdomadaire</a>
-          </li>
-          <li class="nav-item">
-            <a class="nav-link" id="cqm-tab" data-toggle="tab" href="#cqm" role="tab">CQM Mensuel</a>
-          </li>
-          <li class="nav-item">
-            <a class="nav-link" id="cqs-tab" data-toggle="tab" href="#cqs" role="tab">CQS Semestriel</a>
-          </li>
-        </ul>
-
-                                  
-        <div style="margin-bottom: 16px;">
-        <label for="yearSelectGlobal"><b>Année :</b></label>
-        <select id="yearSelectGlobal" class="form-control" style="width:auto; display:inline-block;">
-            <option value="2024">2024</option>
-            <option value="2025" selected>2025</option>
-        </select>
-        </div>
-
-
-                                
-        <div class="tab-content mt-3">
-            <div class="tab-pane fade show active" id="cqh" role="tabpanel">
-                <h5>CQH (par semaine)</h5>
-                <a href="/export_cqh_csv" class="btn btn-success btn-sm mb-2">
-                    ⬇ Télécharger le tableau CQH (Excel/CSV)
-                </a>
-
-                <table class="table table-bordered table-sm">
-                    <thead>
-                        <tr>
-                            <th>Semaine</th>
-                            <th>Year</th>
-                            {% for col in df_cqh.columns if col not in ['Semaine', 'Year'] %}
-                                <th>{{ col }}</th>
-                            {% endfor %}
-                        </tr>
-                    </thead>
-                    <tbody id="table-cqh-body">
-                        {% for _, row in df_cqh.iterrows() %}
-                        <tr data-year="{{ row['Year'] }}">
-                            <td>{{ row["Semaine"] }}</td>
-                            <td>{{ row["Year"] }}</td>
-                            {% for machine in df_cqh.columns if machine not in ['Semaine', 'Year'] %}
-                                {% set val = row[machine] %}
-                                <td class="{{ 'success' if val == '✅' else 'danger' if val == '❌' else '' }}">
-                                    {{ val }}
-                                    {% if val == "❌" %}
-                                        {% set c = commentaires.get((machine, row['Semaine'])) %}
-                                        {% if c %}
-                                            <!-- Si commentaire existe, badge coloré + tooltip -->
-                                            <span 
-                                                class="badge badge-info"
-                                                data-toggle="tooltip"
-                                                data-placement="top"
-                                                style="cursor:pointer;"
-                                                title="{{ c['commentaire'] }} ({{ c['auteur'] }})"
-                                                onclick="ouvrirCommentaire('{{ machine }}', '{{ row['Semaine'] }}')">
-                                                💬
-                                            </span>
-                                        {% else %}
-                                            <!-- Sinon, bouton discret pour ajouter -->
-                                            <button class="btn btn-link btn-sm p-0"
-                                                title="Ajouter un commentaire"
-                                                onclick="ouvrirCommentaire('{{ machine }}', '{{ row['Semaine'] }}')">
-                                                💬
-                                            </button>
-                                        {% endif %}
-                                    {% endif %}
-                                </td>
-                            {% endfor %}
-                        </tr>
-                        {% endfor %}
-                    </tbody>
-                </table>
-            </div>
-
-
-
-
-            <div class="tab-pane fade" id="cqm" role="tabpanel">
-            <h5>CQM (par mois)</h5>
-            <table class="table table-bordered table-sm">
-                <thead>
-                <tr>
-                    <th>Mois</th>
-                    <th>Year</th>
-                    {% for col in df_cqm.columns if col not in ['Mois', 'Year'] %}
-                    <th>{{ col }}</th>
-                    {% endfor %}
-                </tr>
-                </thead>
-                <tbody>
-                {% for _, row in df_cqm.iterrows() %}
-                <tr data-year="{{ row['Year'] }}">
-                    <td>{{ row["Mois"] }}</td>
-                    <td>{{ row["Year"] }}</td>
-                    {% for machine in df_cqm.columns if machine not in ['Mois', 'Year'] %}
-                        {% set val = row[machine] %}
-                        <td class="{{ 'success' if val == '✅' else 'danger' if val == '❌' else '' }}">
-                            {{ val }}
-                            {% if val == "❌" %}
-                                {% set c = commentaires.get((machine, row['Mois'])) %}
-                                {% if c %}
-                                    <span 
-                                        class="badge badge-info"
-                                        data-toggle="tooltip"
-                                        data-placement="top"
-                                        style="cursor:pointer;"
-                                        title="{{ c['commentaire'] }} ({{ c['auteur'] }})"
-                                        onclick="ouvrirCommentaire('{{ machine }}', '{{ row['Mois'] }}')">
-                                        💬
-                                    </span>
-                                {% else %}
-                                    <button class="btn btn-link btn-sm p-0"
-                                        title="Ajouter un commentaire"
-                                        onclick="ouvrirCommentaire('{{ machine }}', '{{ row['Mois'] }}')">
-                                        💬
-                                    </button>
-                                {% endif %}
-                            {% endif %}
-                        </td>
-                    {% endfor %}
-                </tr>
-                {% endfor %}
-                </tbody>
-
-            </table>
-            </div>
-
-
-        <div class="tab-pane fade" id="cqs" role="tabpanel">
-        <h5>CQS (par semestre)</h5>
-        <table class="table table-bordered table-sm">
-            <thead>
-            <tr>
-                <th>Semestre</th>
-                <th>Year</th>
-                {% for col in df_cqs.columns if col not in ['Semestre', 'Year'] %}
-                <th>{{ col }}</th>
-                {% endfor %}
-            </tr>
-            </thead>
-            <tbody>
-            {% for _, row in df_cqs.iterrows() %}
-            <tr data-year="{{ row['Year'] }}">
-                <td>{{ row["Semestre"] }}</td>
-                <td>{{ row["Year"] }}</td>
-                {% for machine in df_cqs.columns if machine not in ['Semestre', 'Year'] %}
-                    {% set val = row[machine] %}
-                    <td class="{{ 'success' if val == '✅' else 'danger' if val == '❌' else '' }}">
-                        {{ val }}
-                        {% if val == "❌" %}
-                            {% set c = commentaires.get((machine, row['Semestre'])) %}
-                            {% if c %}
-                                <span 
-                                    class="badge badge-info"
-                                    data-toggle="tooltip"
-                                    data-placement="top"
-                                    style="cursor:pointer;"
-                                    title="{{ c['commentaire'] }} ({{ c['auteur'] }})"
-                                    onclick="ouvrirCommentaire('{{ machine }}', '{{ row['Semestre'] }}')">
-                                    💬
-                                </span>
-                            {% else %}
-                                <button class="btn btn-link btn-sm p-0"
-                                    title="Ajouter un commentaire"
-                                    onclick="ouvrirCommentaire('{{ machine }}', '{{ row['Semestre'] }}')">
-                                    💬
-                                </button>
-                            {% endif %}
-                        {% endif %}
-                    </td>
-                {% endfor %}
-            </tr>
-            {% endfor %}
-            </tbody>
-
-        </table>
-        </div>
-
-
-        <a href="/" class="btn btn-secondary mt-3">⬅ Retour</a>
-      </div>
-
-      <script src="https://code.jquery.com/jquery-3.6.0.min.js"></script>
-      <script src="https://cdn.jsdelivr.net/npm/bootstrap@4.6.2/dist/js/bootstrap.bundle.min.js"></script>
-                                  
-            <!-- Modale pour ajouter un commentaire -->
-        <div class="modal fade" id="modalCommentaire" tabindex="-1">
-        <div class="modal-dialog">
-            <form class="modal-content" onsubmit="submitCommentaire(); return false;">
-            <div class="modal-header">
-                <h5 class="modal-title">Ajouter un commentaire</h5>
-                <button type="button" class="close" data-dismiss="modal">&times;</button>
-            </div>
-            <div class="modal-body">
-                <input type="hidden" id="modal_machine">
-                <input type="hidden" id="modal_semaine">
-                <div class="form-group">
-                <label>Commentaire :</label>
-                <textarea class="form-control" id="modal_commentaire" required></textarea>
-                </div>
-                <div class="form-group">
-                <label>Votre nom :</label>
-                <input type="text" class="form-control" id="modal_auteur" required>
-                </div>
-            </div>
-            <div class="modal-footer">
-                <button class="btn btn-primary" type="submit">Enregistrer</button>
-            </div>
-            </form>
-        </div>
-        </div>
-        <script>
-        function ouvrirCommentaire(machine, semaine) {
-        $('#modal_machine').val(machine);
-        $('#modal_semaine').val(semaine);
-        $('#modal_commentaire').val('');
-        $('#modal_auteur').val('');
-        $('#modalCommentaire').modal('show');
-        }
+    years = conformite.annees()
+    annee = request.args.get("annee", type=int)
+    if annee not in years:
+        annee = years[-1]
+    df_cqh_final = conformite.tableau("CQH", annee)
+    df_cqm_final = conformite.tableau("CQM", annee)
+    df_cqs_final = conformite.tableau("CQS", annee)
+
+    commentaires = stock_commentaires.annee(annee)
+
+    contexte = dict(df_cqh=df_cqh_final, df_cqm=df_cqm_final, df_cqs=df_cqs_final, commentaires=commentaires, annee=annee,
+                    exports=liens_export(calendrier, annee))
+    if request.args.get("fragment"):
+        return render_template("cq_dashboard_annee.html", **contexte)
+
+    #a personaliser a souhait (templates/cq_dashboard.html) avec logo du centre, préférence de police, disposition etc..
+    return render_template("cq_dashboard.html", years=years, **contexte)
+
+@app.route("/api/compliance/taux")
+def api_taux():
+    # Taux par machine de l'année (comme la page d'accueil) et sur les fenêtres glissantes TAUX_GLISSANTS_SEMAINES,
+    # lus dans les compteurs de la table des états (fenêtres absentes tant qu'elle n'est pas construite)
+    annee = request.args.get("annee", date.today().year, type=int)
+    if annee not in calendrier.annees():
+        return jsonify({"erreur": f"année non suivie : {annee}"}), 404
+    machines, *taux = get_taux_conformite(annee)
+    try:
+        fenetres = etats_cq.taux_fenetres()
+    except sqlite3.Error as e:
+        print(f"❌ Erreur lecture des états de conformité : {e}")
+        fenetres = {}
+    return jsonify({
+        "annee": annee,
+        "machines": machines,
+        "taux": dict(zip(TYPES_CQ, taux)),
+        "moyennes": {typ: moyenne_taux(t) for typ, t in zip(TYPES_CQ, taux)},
+        "glissants": {str(semaines): dict(zip(TYPES_CQ, t[1:])) for semaines, t in fenetres.items() if t is not None},
+    })
+
+
+@app.route("/api/compliance/<typ>")
+def api_compliance(typ):
+    # Tableau de conformité en JSON pour les écrans muraux : ETag = empreinte du tableau (calculée une fois par
+    # instantané), 304 Not Modified tant que les données n'ont pas changé
+    typ = typ.upper()
+    if typ not in TYPES_CQ:
+        return jsonify({"erreur": f"type inconnu : {typ.lower()} (cqh, cqm ou cqs)"}), 404
+    try:
+        conformite = conformite_courante()
+    except Exception as e:
+        return jsonify({"erreur": f"Erreur SQL : {e}"}), 503
 
-        function submitCommentaire() {
-        fetch('/ajoute_commentaire', {
-            method: 'POST',
-            headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({
-            machine: $('#modal_machine').val(),
-            semaine: $('#modal_semaine').val(),
-            commentaire: $('#modal_commentaire').val(),
-            auteur: $('#modal_auteur').val()
-            })
-        }).then(response => {
-            $('#modalCommentaire').modal('hide');
-            location.reload();
-        });
-        }
-        </script>
-        <script>
-        $(function () {
-        $('[data-toggle="tooltip"]').tooltip()
-        })
-        </script>
-
-        <script>
-        function filtreParAnnee(annee) {
-        // Toutes les tables qui ont des lignes data-year
-        document.querySelectorAll('tbody tr[data-year]').forEach(function(tr) {
-            tr.style.display = (tr.getAttribute('data-year') == annee) ? '' : 'none';
-        });
-        }
+    annee = request.args.get("annee", conformite.today.year, type=int)
+    if annee not in conformite.annees():
+        return jsonify({"erreur": f"année non suivie : {annee}"}), 404
+    corps, empreinte = conformite.json_tableau(typ, annee)
 
-        document.addEventListener('DOMContentLoaded', function() {
-        var sel = document.getElementById('yearSelectGlobal');
-        if(sel) {
-            filtreParAnnee(sel.value); // Initial
-            sel.addEventListener('change', function() {
-            filtreParAnnee(this.value);
-            });
-        }
-        });
-        </script>
+    response = app.response_class(corps, mimetype="application/json")
+    response.set_etag(empreinte)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
 
-    </body>
-    </html>
-    """, df_cqh=df_cqh_final, df_cqm=df_cqm_final, df_cqs=df_cqs_final, commentaires=commentaires, years=years)
 
 @app.route('/ajoute_commentaire', methods=['POST'])
 def ajoute_commentaire():
@@ -1320,155 +931,151 @@ def ajoute_commentaire():
     semaine = data['semaine']
     commentaire = data['commentaire']
     auteur = data.get('auteur', 'inconnu')
-    conn = sqlite3.connect("commentaires_cq.db")
-    c = conn.cursor()
-    c.execute("INSERT INTO commentaires (machine, semaine, commentaire, auteur) VALUES (?, ?, ?, ?)",
-              (machine, semaine, commentaire, auteur))
-    conn.commit()
-    conn.close()
+    annee = int(data['annee']) if data.get('annee') else None
+    stock_commentaires.ajouter(machine, semaine, commentaire, auteur, annee)
     return jsonify({"status": "ok"})
 
 
+@app.route('/commentaire', methods=['POST'])
+def commentaire_badge():
+    # Ajout d'un commentaire depuis le dashboard : renvoie seulement le badge de la cellule (index mémoire mis à jour
+    # à l'écriture, ni extraction SQL ni recalcul des tableaux)
+    data = request.json
+    machine, semaine = data['machine'], data['semaine']
+    annee = int(data['annee']) if data.get('annee') else None
+    annee = stock_commentaires.ajouter(machine, semaine, data['commentaire'], data.get('auteur', 'inconnu'), annee)
+    return render_template("cq_commentaire.html", machine=machine, periode=semaine, annee=annee,
+                           c=stock_commentaires.commentaire(machine, semaine, annee))
+
+
+@app.route("/cache_stats")
+def cache_stats():
+    return jsonify({**cache_cq.stats(), "sync": sync_cq.stats(), "classification": regles.stats(),
+                    "pool": pool_sql.stats(), "commentaires": stock_commentaires.stats(),
+                    "notifications": notifications.stats(), "alertes": alertes.stats(),
+                    "etats": etats_cq.stats(),
+                    "pid": os.getpid(), "taches_planifiees": scheduler is not None})
+
+
 @app.route("/audit_machines")
 def audit_machines():
-    if not UNKNOWN_MACHINES_CQH:
+    # Les machines inconnues sont exclues de l'extraction partagée : requête dédiée sur les modules CQH
+    import pandas as pd
+    machines = sorted(MACHINES)
+    modules = sorted(regles.modules("CQH"))
+    query = f"""
+        SELECT DISTINCT cs.Name, cs.Id_Object, cs.StudyDate
+        FROM CONTROLE_STUDY cs
+        WHERE cs.StudyDate IS NOT NULL
+          AND {EXISTE_RESULTAT}
+          AND cs.Id_UserModule IN ({marqueurs(modules)})
+          AND cs.Id_Object NOT IN ({marqueurs(machines)})
+    """
+    try:
+        with pool_sql.connexion() as conn:
+            df = pd.read_sql(query, conn, params=modules + machines)
+    except Exception as e:
+        return f"Erreur SQL : {e}", 500
+    if df.empty:
         return "<p>Aucune machine inconnue détectée.</p>"
 
-    df = pd.DataFrame(UNKNOWN_MACHINES_CQH)
-    html = df[["Name", "Id_Object", "StudyDate"]].drop_duplicates().to_html(index=False)
+    html = df[["Name", "Id_Object", "StudyDate"]].to_html(index=False)
     return f"<h2>Machines non reconnues</h2>{html}"
 
-if __name__ == "__main__":
+# --- Tâches planifiées (alerte Teams, rafraichissement du cache) ---
 
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+def rafraichir_instantane():
+    # Rafraichissement du cache puis report des nouvelles études dans la table des états
+    cache_cq.rafraichir()
+    try:
+        rows, _ = cache_cq.get_snapshot()
+        etats_cq.mettre_a_jour(rows)
+    except Exception as e:
+        print(f"❌ Erreur mise à jour des états de conformité : {e}")
 
-    WEBHOOK_URL = "https://exemple.ezgeghguzeguze4654654ef6ezgf"
-
-    def send_teams_alert_cqh(machines_en_retard, week_num):
-        if not machines_en_retard:
-            return  # rien à envoyer
-        txt = (
-            f"🚨 **Alerte CQH hebdo**\n\n"
-            f"Les CQH suivants n'ont pas été réalisés pour la semaine {week_num} :\n"
-            + "\n".join(f"• {m}" for m in machines_en_retard) +
-            "\nMerci de vérifier avant la clôture de la semaine !"
-        )
-        payload = {"text": txt}
-        try:
-            r = requests.post(WEBHOOK_URL, json=payload, verify=False)
-            print(f"[CQH] Notification Teams envoyée. Status: {r.status_code}")
-        except Exception as e:
-            print(f"[CQH] Erreur d'envoi Teams : {e}")
 
-    def verif_cqh_et_alerte():
-        print("🔔 [TEST] Exécution de la tâche automatique CQH")
-        try:
-            # Utilise la même logique que /cq_dashboard pour être cohérent
-            # On récupère le tableau CQH semaine/machine déjà généré dans get_taux_conformite()
-            today = date.today()
-            machines, taux_cqh, _, _ = get_taux_conformite()
-            
-            # 1. On veut le DataFrame semaine-machine ("df_cqh_final" dans /cq_dashboard)
-            # On régénère le DataFrame comme dans la fonction
-            # Générer les semaines complètes pour 2024 et 2025 (lundi-vendredi)
-            semaines = []
-            current = date(2023, 12, 25)  # pour être sûr d'inclure S1 de 2024
-            current -= timedelta(days=current.weekday())
-            while current.year < 2026:
-                y, w, _ = current.isocalendar()
-                if y >= 2024:
-                    semaines.append({
-                        "Semaine": f"S{w}",
-                        "DateDebut": current,
-                        "DateFin": current + timedelta(days=4)
-                    })
-                current += timedelta(weeks=1)
-            df_semaines = pd.DataFrame(semaines)
-
-
-            # Requête SQL simplifiée
-            conn = pyodbc.connect(conn_str, timeout=5)
-            rows = pd.read_sql("""
-                SELECT cs.Id_Object, cs.Id_UserModule, cs.Name, cs.StudyDate
-                FROM CONTROLE_STUDY cs
-                JOIN RESULT r ON cs.Id_ControleStudy = r.Id_ControleStudy
-                WHERE cs.StudyDate IS NOT NULL
-            """, conn)
-            conn.close()
-            rows['StudyDate'] = pd.to_datetime(rows['StudyDate'])
+def verifier_alertes():
+    # Périodes en cours CQH / CQM / CQS, évaluées sur les seules études arrivées depuis le passage précédent
+    try:
+        rows, _ = cache_cq.get_snapshot()
+        alertes.evaluer(rows)
+    except Exception as e:
+        print(f"❌ Erreur lors de l'évaluation des alertes CQ : {e}")
 
-            MODULES_PAR_TYPE = {
-                "CQH": {66, 64, 63, 62, 61, 60},
-            }
 
-            real_cqh = []
-            for _, row in rows.iterrows():
-                module_id = row["Id_UserModule"]
-                id_obj = row["Id_Object"]
-                name = row["Name"]
-                study_date = row["StudyDate"]
-                if id_obj in [99, 121]:  # TOMO1 ou TOMO2
-                    if not CQH_REGEX.search(str(name)):
-                        continue
-                else:
-                    if module_id not in MODULES_PAR_TYPE["CQH"]:
-                        continue
-                if id_obj not in MACHINES: continue
-                if pd.isna(study_date): continue
-                study_date = pd.to_datetime(study_date).date()
-                real_cqh.append({"Id_Object": id_obj, "Date": study_date})
-
-            df_cqh = pd.DataFrame(real_cqh)
-
-            machines_cqh = sorted(df_cqh['Id_Object'].unique())
-            cqh_data = []
-            for _, sem in df_semaines.iterrows():
-                row = {"Semaine": sem["Semaine"], "Year": sem["DateDebut"].year}
-                for id_obj in MACHINES.keys():
-                    machine_name = MACHINES.get(id_obj, ("❓",))[0]
-                    done = df_cqh[
-                        (df_cqh["Id_Object"] == id_obj) &
-                        (df_cqh["Date"] >= sem["DateDebut"]) &
-                        (df_cqh["Date"] <= sem["DateFin"])
-                    ]
-                    if not done.empty:
-                        row[machine_name] = "✅"
-                    elif sem["DateFin"] < today:
-                        row[machine_name] = "❌"
-                    else:
-                        row[machine_name] = "⏳"
-                cqh_data.append(row)
-            df_cqh_final = pd.DataFrame(cqh_data)
-
-            # 2. Repère la semaine en cours
-            week_num = today.isocalendar()[1]
-            week_label = f"S{week_num}"
-            # On prend la ligne de la semaine en cours
-            current_week_row = df_cqh_final[df_cqh_final["Semaine"] == week_label]
-            if current_week_row.empty:
-                #print("⚠️ Semaine en cours introuvable dans le tableau CQH.")
-                return
-
-            row = current_week_row.iloc[0]
-            print("Colonnes DataFrame CQH :", list(df_cqh_final.columns))
-            print("MACHINES dans la boucle d’alerte :", [m[0] for m in MACHINES.values()])
-            # Liste des machines non faites (pas '✅') cette semaine
-            machines_en_retard = [m for m in MACHINES.values() if row.get(m[0]) != "✅"]
-            machines_names = [m[0] for m in machines_en_retard]
-
-            if machines_names:
-                #print(f"[CQH] Machines sans CQH cette semaine ({week_num}) :", machines_names)
-                send_teams_alert_cqh(machines_names, week_num)
-            else:
-                print(f"[CQH] Tous les CQH sont faits pour la semaine {week_num}")
-        except Exception as e:
-            print(f"[CQH] Erreur lors du contrôle hebdo : {e}")
+def verrou_exclusif(chemin):
+    # Verrou de fichier non bloquant gardé toute la vie du processus : None si un autre processus le détient déjà
+    f = open(chemin, "a+")
+    try:
+        f.seek(0)
+        if os.name == "nt":
+            import msvcrt
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+_verrou_scheduler = None
+scheduler = None
+
+
+def demarrer_taches_planifiees():
+    # Un seul scheduler par déploiement, quel que soit le nombre de workers : le processus qui obtient le verrou
+    # lance les tâches et les extractions SQL, les autres suivent l'instantané local qu'il écrit
+    global _verrou_scheduler, scheduler
+    if scheduler is not None:
+        return True
+    _verrou_scheduler = verrou_exclusif(SCHEDULER_VERROU)
+    if _verrou_scheduler is None:
+        sync_cq.suiveur = True
+        print(f"ℹ️ Processus {os.getpid()} : tâches planifiées déjà lancées par un autre processus")
+        return False
 
+    import urllib3
+    from apscheduler.schedulers.background import BackgroundScheduler
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
     scheduler = BackgroundScheduler()
-    scheduler.add_job(verif_cqh_et_alerte, 'cron', day_of_week='wed', hour=16, minute=0)
-    scheduler.add_job(verif_cqh_et_alerte, 'cron', day_of_week='fri', hour=16, minute=0)
+    scheduler.add_job(verifier_alertes, 'interval', seconds=ALERTES_INTERVALLE_SECONDES)
+    scheduler.add_job(rafraichir_instantane, 'interval', seconds=CACHE_TTL_SECONDES, next_run_time=datetime.now())
     scheduler.start()
+    notifications.demarrer()
+    print(f"✅ Processus {os.getpid()} : tâches planifiées lancées")
+    return True
+
+
+def servir():
+    # Mode production : waitress (multi-thread, Windows et Linux), ou gunicorn multi-processus si SERVE_WORKERS > 1 (Linux)
+    if SERVE_WORKERS > 1:
+        from gunicorn.app.base import BaseApplication
 
+        class ServeurGunicorn(BaseApplication):
+            def load_config(self):
+                self.cfg.set("bind", f"{SERVE_HOTE}:{SERVE_PORT}")
+                self.cfg.set("workers", SERVE_WORKERS)
+                self.cfg.set("threads", SERVE_THREADS)
+                self.cfg.set("post_worker_init", lambda worker: demarrer_taches_planifiees())
 
-    app.run(host="0.0.0.0", port=5000)
+            def load(self):
+                return app
 
+        ServeurGunicorn().run()
+    else:
+        from waitress import serve
+        demarrer_taches_planifiees()
+        serve(app, host=SERVE_HOTE, port=SERVE_PORT, threads=SERVE_THREADS)
+
+
+if __name__ == "__main__":
+    # Lancement manuel : saisie des identifiants au clavier si rien n'est configuré
+    identifiants_sql(interactif=True)
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        servir()
+    else:
+        # Serveur de développement Flask (un seul processus, une requête lente bloque les autres)
+        demarrer_taches_planifiees()
+        app.run(host="0.0.0.0", port=5000)
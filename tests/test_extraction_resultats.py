@@ -0,0 +1,90 @@
+# Extraction des CQ : la requête du dashboard (semi-jointure EXISTS sur RESULT, une ligne par étude) doit donner
+# exactement les mêmes tableaux et taux de conformité que l'ancienne jointure, qui renvoyait l'étude une fois par
+# résultat, avec ou sans le filtre poussé côté SQL (filtre_extraction_cq)
+# Usage : python -m pytest tests
+import os
+import random
+import sqlite3
+import sys
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from config import MACHINES, MODULES_PAR_TYPE  # noqa: E402
+from cq_conformite import calculer_conformite  # noqa: E402
+from cq_regles import TYPES_CQ, ReglesClassification  # noqa: E402
+from dashboard_cq_artiscan import REQUETE_CQ, EXISTE_RESULTAT, filtre_extraction_cq  # noqa: E402
+
+TODAY = date(2025, 6, 15)
+
+# Requête d'extraction d'avant la semi-jointure (référence)
+REQUETE_JOINTURE = """
+    SELECT cs.Id_ControleStudy, cs.Id_Object, cs.Id_UserModule, cs.Name, cs.StudyDate
+    FROM CONTROLE_STUDY cs
+    JOIN RESULT r ON cs.Id_ControleStudy = r.Id_ControleStudy
+    WHERE cs.StudyDate IS NOT NULL
+"""
+
+
+def base_artiscan(n=3000, seed=0):
+    # Études sur 2024-2025 avec 0 à 40 résultats chacune (0 : étude sans résultat, exclue par les deux requêtes)
+    rnd = random.Random(seed)
+    modules = sorted(set().union(*MODULES_PAR_TYPE.values())) + [24, 25, 26, 200]
+    noms = ["CQH hebdo", "CQM mensuel", "CQS semestriel", "Contrôle qualité hebdo", "Daily", "test cqh"]
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE CONTROLE_STUDY (Id_ControleStudy INTEGER PRIMARY KEY, Id_Object INTEGER, "
+                 "Id_UserModule INTEGER, Name TEXT, StudyDate TEXT)")
+    conn.execute("CREATE TABLE RESULT (Id_Result INTEGER PRIMARY KEY, Id_ControleStudy INTEGER)")
+    for id_etude in range(1, n + 1):
+        jour = datetime(2024, 1, 1) + timedelta(days=rnd.random() * 730)
+        conn.execute("INSERT INTO CONTROLE_STUDY VALUES (?, ?, ?, ?, ?)",
+                     (id_etude, rnd.choice(list(MACHINES) + [999]), rnd.choice(modules), rnd.choice(noms),
+                      None if rnd.random() < 0.01 else jour.isoformat(sep=" ")))
+        conn.executemany("INSERT INTO RESULT (Id_ControleStudy) VALUES (?)",
+                         [(id_etude,)] * rnd.choice([0, 1, 2, 5, 12, 40]))
+    return conn
+
+
+def extraction(conn, requete, params=()):
+    # Dates passées comme dans la base (texte ISO) : pas d'adaptateur datetime implicite de sqlite3
+    params = [p.isoformat(sep=" ") if isinstance(p, datetime) else p for p in params]
+    rows = pd.read_sql(requete, conn, params=params)
+    rows["StudyDate"] = pd.to_datetime(rows["StudyDate"])
+    return rows
+
+
+@pytest.fixture(scope="module")
+def base():
+    return base_artiscan()
+
+
+@pytest.fixture(scope="module", params=[False, True], ids=["sans_filtre", "filtre_extraction_cq"])
+def extractions(request, base):
+    condition, params = filtre_extraction_cq() if request.param else ("", [])
+    return (extraction(base, REQUETE_JOINTURE + condition, params),
+            extraction(base, REQUETE_CQ + condition, params))
+
+
+def test_requete_dashboard_semi_jointure():
+    assert EXISTE_RESULTAT in REQUETE_CQ
+    assert "JOIN" not in REQUETE_CQ.upper()
+
+
+def test_une_ligne_par_etude(extractions):
+    jointure, exists = extractions
+    assert len(jointure) > 5 * len(exists)
+    assert exists["Id_ControleStudy"].is_unique
+    assert set(exists["Id_ControleStudy"]) == set(jointure["Id_ControleStudy"])
+
+
+@pytest.mark.parametrize("typ", TYPES_CQ)
+def test_tableaux_et_taux_identiques(extractions, typ):
+    jointure, exists = extractions
+    avant = calculer_conformite(jointure, today=TODAY, regles=ReglesClassification())
+    apres = calculer_conformite(exists, today=TODAY, regles=ReglesClassification())
+    assert avant.annees() == apres.annees() == [2024, 2025]
+    for annee in avant.annees():
+        pd.testing.assert_frame_equal(avant.tableau(typ, annee), apres.tableau(typ, annee))
+        assert avant.taux(annee) == apres.taux(annee)
@@ -0,0 +1,97 @@
+# File de notifications Teams contre un webhook local (http.server) : renvoi après une erreur serveur,
+# dédoublonnage par clé et reprise des notifications en attente par un nouveau dispatcheur sur la même base
+# Usage : python -m pytest tests
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from cq_notifications import DispatcheurTeams  # noqa: E402
+
+
+class WebhookLocal(ThreadingHTTPServer):
+    # Répond avec les codes de `reponses` dans l'ordre (200 ensuite) et garde les corps reçus
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), RequeteWebhook)
+        self.reponses = []
+        self.recus = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/webhook"
+
+
+class RequeteWebhook(BaseHTTPRequestHandler):
+    def do_POST(self):
+        corps = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.recus.append(json.loads(corps))
+        code = self.server.reponses.pop(0) if self.server.reponses else 200
+        self.send_response(code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def webhook():
+    serveur = WebhookLocal()
+    thread = threading.Thread(target=serveur.serve_forever, daemon=True)
+    thread.start()
+    yield serveur
+    serveur.shutdown()
+    serveur.server_close()
+
+
+def dispatcheur(webhook, chemin):
+    return DispatcheurTeams(url=webhook.url, chemin=str(chemin), timeout=(2, 2), essais_max=3,
+                            delai_initial=0, delai_max=0)
+
+
+def test_renvoi_apres_erreur_serveur(webhook, tmp_path):
+    webhook.reponses = [500]
+    d = dispatcheur(webhook, tmp_path / "notifications.db")
+    d.enfiler({"text": "CQH en retard"}, ["CQH|2025-S12|NOVALIS"])
+
+    assert d.envoyer_en_attente() == 0
+    assert d.stats()["echecs"] == 1 and d.stats()["en_attente"] == 1
+
+    assert d.envoyer_en_attente() is None
+    stats = d.stats()
+    assert (stats["envoyees"], stats["echecs"], stats["en_attente"], stats["abandonnees"]) == (1, 1, 0, 0)
+    assert webhook.recus == [{"text": "CQH en retard"}] * 2
+
+
+def test_cle_deja_notifiee_rejetee(webhook, tmp_path):
+    d = dispatcheur(webhook, tmp_path / "notifications.db")
+    assert d.enfiler({"text": "CQM en retard"}, ["CQM|2025-03|NOVALIS"]) is not None
+    assert d.enfiler({"text": "CQM en retard (bis)"}, ["CQM|2025-03|NOVALIS"]) is None
+    assert d.nouvelles_cles(["CQM|2025-03|NOVALIS", "CQM|2025-03|TOMO"]) == ["CQM|2025-03|TOMO"]
+
+    d.envoyer_en_attente()
+    assert d.stats()["doublons"] == 1
+    assert webhook.recus == [{"text": "CQM en retard"}]
+
+
+def test_reprise_au_redemarrage(webhook, tmp_path):
+    chemin = tmp_path / "notifications.db"
+    # Notification enfilée puis processus arrêté avant l'envoi
+    dispatcheur(webhook, chemin).enfiler({"text": "CQS en retard"}, ["CQS|2025-S1|NOVALIS"])
+    assert webhook.recus == []
+
+    d = dispatcheur(webhook, chemin)
+    assert d.stats()["en_attente"] == 1
+    d.demarrer()
+    limite = time.monotonic() + 5
+    while d.stats()["en_attente"] and time.monotonic() < limite:
+        time.sleep(0.05)
+    assert webhook.recus == [{"text": "CQS en retard"}]
+    assert d.stats()["envoyees"] == 1
+    # La clé reste connue après le redémarrage
+    assert d.enfiler({"text": "CQS en retard"}, ["CQS|2025-S1|NOVALIS"]) is None